@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+"""cutter benchmark
+
+Generates synthetic wav images with cue sheets and splits them with
+cutter.py, using stand-in encoders which only drain their input (the
+cost left is cutter's own) and, with --real, the installed codecs.
+"""
+
+from cutter.formats import wavfile
+
+import subprocess
+import tempfile
+import argparse
+import platform
+import shutil
+import json
+import time
+import sys
+import os
+
+CUTTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cutter.py")
+
+STANDIN = """#!%s
+import sys
+
+args = sys.argv[1:]
+out = args[args.index("-o") + 1] if "-o" in args else args[-1]
+
+stdin = getattr(sys.stdin, "buffer", sys.stdin)
+while len(stdin.read(0x10000)):
+	pass
+
+if out != "-":
+	open(out, "wb").close()
+"""
+
+STANDIN_TOOLS = ["sox", "flac", "oggenc", "lame"]
+
+# runs cutter and saves its own peak rss, the rusage of wait4 covers the
+# reaped encoders too and its maximum may be theirs
+MEASURE_RSS = """
+import resource, atexit, runpy, sys, os
+
+rssfile = sys.argv.pop(1)
+
+def report():
+	with open(rssfile, "w") as fp:
+		fp.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+atexit.register(report)
+sys.argv.pop(0)
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+# name, number of tracks, track length (seconds), rate, bits, channels
+SCENARIOS = [
+	("cd", 12, 50, 44100, 16, 2),
+	("hires", 10, 30, 96000, 24, 2),
+	("mono", 12, 50, 22050, 16, 1),
+	("audiobook", 500, 2, 44100, 16, 2),
+]
+
+def printf(fmt, *args):
+	sys.stdout.write(fmt % args)
+	sys.stdout.flush()
+
+def which(name):
+	for path in os.environ.get("PATH", "").split(os.pathsep):
+		fullname = os.path.join(path, name)
+		if os.path.isfile(fullname) and os.access(fullname, os.X_OK):
+			return fullname
+
+	return None
+
+def msf(ts):
+	return "%02d:%02d:%02d" % (ts // (60 * 75), ts // 75 % 60, ts % 75)
+
+def make_image(dir, ntracks, length, rate, bits, channels, scale):
+	nframes = int(ntracks * length * rate * scale)
+	sample_width = bits // 8
+
+	path = os.path.join(dir, "image.wav")
+	block = os.urandom(0x100000)
+	size = nframes * channels * sample_width
+
+	with open(path, "wb") as fp:
+		fp.write(wavfile.header(channels, sample_width, rate, nframes))
+		while size > 0:
+			fp.write(block[:size])
+			size -= len(block)
+
+	with open(os.path.join(dir, "image.cue"), "w") as fp:
+		fp.write('PERFORMER "Bench"\nTITLE "Synthetic"\n')
+		fp.write('FILE "image.wav" WAVE\n')
+
+		for n in range(ntracks):
+			fp.write("  TRACK %02d AUDIO\n" % (n + 1))
+			fp.write('    TITLE "Track %d"\n' % (n + 1))
+			fp.write("    INDEX 01 %s\n" % msf(int(n * length * scale * 75)))
+
+	return os.path.join(dir, "image.cue"), os.path.getsize(path)
+
+def make_standins(dir):
+	bindir = os.path.join(dir, "bin")
+	os.mkdir(bindir)
+
+	for name in STANDIN_TOOLS:
+		path = os.path.join(bindir, name)
+		with open(path, "w") as fp:
+			fp.write(STANDIN % sys.executable)
+		os.chmod(path, 0o755)
+
+	return bindir
+
+class Runner:
+	def __init__(self, opt, workdir):
+		self.opt = opt
+		self.workdir = workdir
+
+		home = os.path.join(workdir, "home")
+		os.mkdir(home)
+
+		self.env = dict(os.environ, HOME=home)
+		self.standin_env = dict(self.env, PATH=make_standins(workdir)
+			+ os.pathsep + os.environ.get("PATH", ""))
+
+	def measure(self, cuefile, env, type, jobs):
+		outdir = os.path.join(self.workdir, "out")
+		rssfile = os.path.join(self.workdir, "rss")
+		best = None
+
+		for _ in range(self.opt.repeat):
+			args = [sys.executable, "-c", MEASURE_RSS, rssfile, CUTTER, cuefile,
+				"-t", type, "-d", outdir, "-j", str(jobs), "--no-progress", "--no-tempdir"]
+
+			with open(os.devnull, "wb") as null:
+				with tempfile.TemporaryFile() as err:
+					start = time.time()
+					status = subprocess.call(args, env=env, stdout=null, stderr=err)
+					elapsed = time.time() - start
+
+					err.seek(0)
+					msg = err.read()
+
+			shutil.rmtree(outdir, True)
+
+			if status:
+				raise RuntimeError(msg.decode("utf-8", "replace").strip())
+
+			with open(rssfile) as fp:
+				rss = int(fp.read())
+
+			if best is None or elapsed < best[0]:
+				best = elapsed, rss
+
+		return best
+
+	def run(self, scenario):
+		name, ntracks, length, rate, bits, channels = scenario
+
+		dir = os.path.join(self.workdir, name)
+		os.mkdir(dir)
+
+		cuefile, size = make_image(dir, ntracks, length, rate, bits,
+			channels, self.opt.scale)
+
+		codecs = [("standin", self.standin_env)]
+		if self.opt.real:
+			if which("sox"):
+				codecs.append(("real", self.env))
+			else:
+				printf("%-10s real codecs are not installed, skipped\n", name)
+
+		results = []
+		for codec, env in codecs:
+			for type in self.opt.types:
+				for jobs in self.opt.jobs:
+					try:
+						elapsed, rss = self.measure(cuefile, env, type, jobs)
+					except RuntimeError as err:
+						printf("%-10s %-7s %-4s -j%-2d FAILED: %s\n",
+							name, codec, type, jobs, err)
+						continue
+
+					result = {
+						"scenario": name,
+						"codecs": codec,
+						"type": type,
+						"jobs": jobs,
+						"tracks": ntracks,
+						"sample_rate": rate,
+						"bits_per_sample": bits,
+						"channels": channels,
+						"bytes": size,
+						"seconds": round(elapsed, 4),
+						"mb_per_sec": round(size / elapsed / (1 << 20), 2),
+						"tracks_per_sec": round(ntracks / elapsed, 2),
+						"peak_rss_kb": rss,
+					}
+
+					printf("%-10s %-7s %-4s -j%-2d %8.2f MB/s %8.2f tracks/s %8d KB\n",
+						name, codec, type, jobs, result["mb_per_sec"],
+						result["tracks_per_sec"], rss)
+
+					results.append(result)
+
+		shutil.rmtree(dir)
+		return results
+
+def parse_list(string):
+	return [s for s in string.split(",") if s]
+
+def main():
+	parser = argparse.ArgumentParser(description="cutter benchmark")
+
+	parser.add_argument("-o", "--output", metavar="FILE",
+		help="save results as json")
+
+	parser.add_argument("--scenarios", type=parse_list,
+		default=[s[0] for s in SCENARIOS],
+		help="comma separated scenarios: %s" % ", ".join(s[0] for s in SCENARIOS))
+
+	parser.add_argument("--types", type=parse_list, default=["wav", "flac"],
+		help="output types (default: wav,flac)")
+
+	parser.add_argument("--jobs", type=lambda s: list(map(int, parse_list(s))),
+		default=[1], help="comma separated numbers of jobs (default: 1)")
+
+	parser.add_argument("--scale", type=float, default=1.0,
+		help="multiply the length of generated images")
+
+	parser.add_argument("--repeat", type=int, default=3,
+		help="runs of each case, the fastest one is reported")
+
+	parser.add_argument("--real", action="store_true",
+		help="also run with the installed codecs")
+
+	parser.add_argument("--workdir", help="where to generate images")
+
+	opt = parser.parse_args()
+
+	scenarios = [s for s in SCENARIOS if s[0] in opt.scenarios]
+	workdir = tempfile.mkdtemp(prefix="cutter-bench-", dir=opt.workdir)
+
+	results = []
+	try:
+		runner = Runner(opt, workdir)
+		for scenario in scenarios:
+			results.extend(runner.run(scenario))
+	finally:
+		shutil.rmtree(workdir, True)
+
+	if opt.output:
+		report = {
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"results": results,
+		}
+
+		with open(opt.output, "w") as fp:
+			json.dump(report, fp, indent=1, sort_keys=True)
+
+if __name__ == "__main__":
+	main()
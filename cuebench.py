@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""cue parser benchmark
+
+Generates a corpus of cue sheets (single and multi file images, quoted
+and unquoted fields, REM comments, pregaps, non-ascii titles) and
+parses all of them with cue.read.
+"""
+
+from cutter import cue
+
+import argparse
+import platform
+import tempfile
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+WORDS = [
+	u"love", u"night", u"blue", u"river", u"song", u"dance", u"heart",
+	u"fire", u"rain", u"stone", u"light", u"dream", u"road", u"home",
+	u"été", u"ночь", u"夜",
+]
+
+GENRES = [u"Rock", u"Jazz", u"Classical", u"Electronic", u"Folk"]
+
+def printf(fmt, *args):
+	sys.stdout.write(fmt % args)
+	sys.stdout.flush()
+
+def msf(ts):
+	return "%02d:%02d:%02d" % (ts // (60 * 75), ts // 75 % 60, ts % 75)
+
+def title(rand):
+	return u" ".join(rand.choice(WORDS) for _ in range(rand.randint(1, 5))).title()
+
+def quoted(rand, value):
+	if u" " in value or rand.random() < 0.5:
+		return u"\"%s\"" % value
+	return value
+
+def make_cue(rand):
+	lines = [
+		u"REM GENRE %s" % rand.choice(GENRES),
+		u"REM DATE %d" % rand.randint(1950, 2020),
+		u"REM COMMENT \"ExactAudioCopy v0.99pb5\"",
+		u"PERFORMER %s" % quoted(rand, title(rand)),
+		u"TITLE %s" % quoted(rand, title(rand)),
+	]
+
+	if rand.random() < 0.3:
+		lines.append(u"CATALOG %013d" % rand.randint(0, 10 ** 13 - 1))
+
+	ntracks = rand.randint(5, 25)
+	multi = rand.random() < 0.3
+	pos = 0
+
+	for n in range(1, ntracks + 1):
+		if n == 1 or multi:
+			lines.append(u"FILE \"%s.%s\" WAVE" % (title(rand) if multi else u"image",
+				rand.choice([u"flac", u"wav", u"ape"])))
+			pos = 0
+
+		lines.append(u"  TRACK %02d AUDIO" % n)
+		lines.append(u"    TITLE %s" % quoted(rand, title(rand)))
+		lines.append(u"    PERFORMER %s" % quoted(rand, title(rand)))
+
+		if rand.random() < 0.2:
+			lines.append(u"    ISRC USABC%07d" % rand.randint(0, 10 ** 7 - 1))
+		if rand.random() < 0.1:
+			lines.append(u"    FLAGS DCP")
+
+		if pos and rand.random() < 0.3:
+			lines.append(u"    INDEX 00 %s" % msf(pos))
+			pos += rand.randint(1, 300)
+
+		lines.append(u"    INDEX 01 %s" % msf(pos))
+		pos += rand.randint(60 * 75, 600 * 75)
+
+	return u"\r\n".join(lines) + u"\r\n"
+
+def make_corpus(dir, count, seed):
+	rand = random.Random(seed)
+	size = 0
+
+	paths = []
+	for n in range(count):
+		path = os.path.join(dir, "%06d.cue" % n)
+		data = make_cue(rand).encode("utf-8")
+
+		with open(path, "wb") as fp:
+			fp.write(data)
+
+		paths.append(path)
+		size += len(data)
+
+	return paths, size
+
+def parse_all(paths):
+	errors = []
+
+	def on_error(lineno, msg):
+		errors.append((lineno, msg))
+
+	for path in paths:
+		if cue.read(path, error_handler=on_error) is None:
+			raise RuntimeError("%s: parsing failed" % path)
+
+	if errors:
+		raise RuntimeError("unexpected errors: %s" % errors[:3])
+
+def main():
+	parser = argparse.ArgumentParser(description="cue parser benchmark")
+
+	parser.add_argument("-o", "--output", metavar="FILE",
+		help="save results as json")
+
+	parser.add_argument("--count", type=int, default=10000,
+		help="number of generated cue sheets (default: 10000)")
+
+	parser.add_argument("--repeat", type=int, default=3,
+		help="parses of the corpus, the fastest one is reported")
+
+	parser.add_argument("--seed", type=int, default=0,
+		help="seed of the corpus generator")
+
+	parser.add_argument("--workdir", help="where to generate the corpus")
+
+	opt = parser.parse_args()
+
+	workdir = tempfile.mkdtemp(prefix="cutter-cuebench-", dir=opt.workdir)
+	try:
+		paths, size = make_corpus(workdir, opt.count, opt.seed)
+
+		best = None
+		for _ in range(opt.repeat):
+			start = time.time()
+			parse_all(paths)
+			elapsed = time.time() - start
+
+			if best is None or elapsed < best:
+				best = elapsed
+	finally:
+		shutil.rmtree(workdir, True)
+
+	result = {
+		"sheets": opt.count,
+		"bytes": size,
+		"seconds": round(best, 4),
+		"sheets_per_sec": round(opt.count / best, 1),
+		"mb_per_sec": round(size / best / (1 << 20), 2),
+	}
+
+	printf("%d sheets, %.2f MB: %.3f s, %.1f sheets/s, %.2f MB/s\n",
+		opt.count, size / float(1 << 20), best,
+		result["sheets_per_sec"], result["mb_per_sec"])
+
+	if opt.output:
+		report = {
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"result": result,
+		}
+
+		with open(opt.output, "w") as fp:
+			json.dump(report, fp, indent=1, sort_keys=True)
+
+if __name__ == "__main__":
+	main()
@@ -1,17 +1,27 @@
 #!/usr/bin/env python
 
-from cutter import formats, cue
+from cutter import formats, cue, accuraterip
 from cutter.coding import to_unicode, to_bytes
 from cutter.splitter import Splitter, StreamInfo
+from cutter.progress import ProgressBoard
+from cutter.index import open_index
 from cutter.tools import *
+from cutter import tools
 
 import argparse
+import multiprocessing
 
 import signal
+import copy
 import sys
 import os
 import re
 
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
 re_range = re.compile("^(\d+)-(\d+)$")
 
 try:
@@ -19,7 +29,7 @@ try:
 except Exception as err:
 	fatal("import config failed: %s", err)
 
-def print_cue(cue):
+def print_cue(cue, index):
 	for k, v in cue.attrs():
 		printf("%s: %s\n", k.upper(), quote(v))
 
@@ -30,7 +40,7 @@ def print_cue(cue):
 		if not os.path.exists(name):
 			printf(": not exists\n")
 		else:
-			info = StreamInfo.get(name)
+			info = StreamInfo.get(name, index)
 			if not info:
 				printf(": unknown type\n")
 			else:
@@ -114,6 +124,8 @@ def read_titles(filename):
 
 	return list(filter(None, [s.strip() for s in fp.readlines()]))
 
+ENGINES = ("thread", "asyncio")
+
 class HelpFormatter(argparse.HelpFormatter):
 	def __init__(self, *args, **kwargs):
 		kwargs["max_help_position"] = 40
@@ -124,12 +136,26 @@ def parse_args():
 		"dir": config.DIR or ".",
 		"fmt": config.FILENAME_FORMAT,
 		"type": config.TYPE,
+		"backend": config.BACKEND or "sox",
 
 		"bitrate": config.MP3_BITRATE,
+		"tag_padding": config.TAG_PADDING,
+		"chunk_size": config.CHUNK_SIZE,
 
 		"convert_chars": config.CONVERT_CHARS,
 		"use_tempdir": config.USE_TEMPDIR,
 		"show_progress": config.PROGRESS,
+		"jobs": config.JOBS or 1,
+		"engine": config.ENGINE or "thread",
+		"buffer_size": config.BUFFER_SIZE or 64,
+		"manifest": config.MANIFEST,
+		"checksum": config.CHECKSUM,
+		"accuraterip": config.ACCURATERIP,
+		"spill": config.SPILL,
+		"spill_dir": config.SPILL_DIR,
+		"cache_dir": config.CACHE_DIR,
+		"cache_size": config.CACHE_SIZE or 1024,
+		"index": config.INDEX,
 
 		"sample_rate": config.SAMPLE_RATE,
 		"channels": config.CHANNELS,
@@ -147,13 +173,16 @@ def parse_args():
 		help="ignore cue parsing errors")
 
 	parser.add_argument("--dump",
-		choices=("cue", "tags", "tracks"),
-		help="print cue data, file tags or track names")
+		choices=("cue", "tags", "tracks", "checksums"),
+		help="print cue data, file tags, track names or accuraterip checksums")
 
 	parser.add_argument("-n", "--dry-run", action="store_true", dest="dry_run")
 
 	parser.add_argument("-v", "--verbose", action="store_true")
 
+	parser.add_argument("--batch", action="store_true",
+		help="process every cue file found under the cuefile directory")
+
 	general = parser.add_argument_group("General options")
 
 	general.add_argument("--tag", action="store_true",
@@ -175,10 +204,59 @@ def parse_args():
 
 	general.add_argument("--tracks", type=parse_tracks, help="select tracks")
 
+	general.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+		help="report time and bytes of every stage per track and album, as json to FILE if given")
+
+	general.add_argument("--manifest", action="store_true",
+		help="record finished tracks in the output directory and skip them on later runs")
+
+	general.add_argument("--checksum", action="store_true",
+		help="compute crc32 and md5 of the audio of each track and keep them in the manifest")
+
+	general.add_argument("--accuraterip", action="store_true",
+		help="compute accuraterip v1/v2 and ctdb checksums of the tracks (needs numpy)")
+
+	general.add_argument("--verify", action="store_true",
+		help="decode split tracks and compare them with the stored checksums, do not split")
+
+	general.add_argument("-j", "--jobs", type=int, metavar="N",
+		help="number of parallel jobs (albums with --batch)")
+
+	general.add_argument("--engine", choices=ENGINES,
+		help="run parallel jobs in threads or drive all processes from one asyncio loop")
+
+	general.add_argument("--buffer-size", type=int,
+		dest="buffer_size", metavar="MB",
+		help="memory for decoded audio shared by parallel jobs")
+
+	general.add_argument("--spill", action="store_true",
+		help="decode non-seekable sources to a temporary file for parallel jobs")
+
+	general.add_argument("--spill-dir", type=parse_dir,
+		dest="spill_dir", metavar="DIR",
+		help="directory for decoded temporary files")
+
+	general.add_argument("--cache-dir", type=parse_dir,
+		dest="cache_dir", metavar="DIR",
+		help="reuse tracks encoded with the same settings from this directory")
+
+	general.add_argument("--cache-size", type=int,
+		dest="cache_size", metavar="MB",
+		help="size limit of the cache, least recently used tracks are removed")
+
+	general.add_argument("--index", type=to_unicode, metavar="FILE",
+		help="keep parsed cue sheets and audio stream parameters in this database")
+
 	enc = parser.add_argument_group("Encoding options")
 
 	enc.add_argument("-t", "--type", type=parse_type, help="output file format")
 
+	enc.add_argument("--backend", choices=("sox", "native"),
+		help="encode with sox or directly with flac, oggenc, lame")
+
+	enc.add_argument("--chunk-size", type=int, dest="chunk_size", metavar="KB",
+		help="size of the chunks of audio written to the encoder")
+
 	enc.add_argument("-C", "--compression", type=int, metavar="FACTOR",
 		help="compression factor for output format (used for flac, ogg)")
 
@@ -217,6 +295,9 @@ def parse_args():
 		else:
 			tag.add_argument("--" + opt, type=to_unicode, default="")
 
+	tag.add_argument("--tag-padding", type=int, dest="tag_padding", metavar="BYTES",
+		help="space reserved in rewritten tags for later in-place updates")
+
 	tag.add_argument("--track-total", type=int, dest="tracktotal", metavar="TOTAL")
 	tag.add_argument("--track-start", type=int, dest="trackstart", metavar="START")
 
@@ -255,6 +336,39 @@ def process_options(opt):
 		if not option_check_range("bitrate", opt.bitrate, 32, 320):
 			return False
 
+	if opt.tag_padding is not None and opt.tag_padding < 0:
+		printerr("invalid tag padding %d, must not be negative", opt.tag_padding)
+		return False
+
+	if opt.accuraterip or opt.dump == "checksums":
+		if not accuraterip.is_available():
+			printerr("accuraterip checksums need numpy, which is not installed")
+			return False
+
+	if opt.chunk_size is not None and opt.chunk_size < 1:
+		printerr("invalid chunk size %d, must be positive", opt.chunk_size)
+		return False
+
+	if opt.jobs < 1:
+		printerr("invalid jobs value %d, must be positive", opt.jobs)
+		return False
+
+	if opt.engine not in ENGINES:
+		printerr("invalid engine %s, must be one of: %s", opt.engine, " ".join(ENGINES))
+		return False
+
+	if opt.engine == "asyncio" and sys.version_info < (3, 5):
+		printerr("asyncio engine needs python 3.5 or later")
+		return False
+
+	if opt.buffer_size < 1:
+		printerr("invalid buffer size %d, must be positive", opt.buffer_size)
+		return False
+
+	if opt.cache_size < 1:
+		printerr("invalid cache size %d, must be positive", opt.cache_size)
+		return False
+
 	if not os.isatty(sys.stdout.fileno()):
 		opt.show_progress = False
 
@@ -262,6 +376,15 @@ def process_options(opt):
 		printerr("--dump and --export-titles-to cannot be used together")
 		return False
 
+	if opt.batch and (opt.export_titles != None or opt.titles != None):
+		printerr("--batch cannot be used with titles import or export")
+		return False
+
+	# every album would overwrite the report of the previous one
+	if opt.batch and opt.stats not in (None, "-"):
+		printerr("--batch cannot be used with --stats FILE")
+		return False
+
 	return True
 
 def find_cuefile(path):
@@ -272,6 +395,13 @@ def find_cuefile(path):
 
 	fatal("no cue file")
 
+def find_cuefiles(root):
+	for path, dirs, files in os.walk(root):
+		dirs.sort()
+		for file in sorted(files):
+			if file.endswith(".cue"):
+				yield os.path.normpath(os.path.join(path, file))
+
 def switch(value, opts):
 	opts.get(value, lambda: None)()
 
@@ -320,19 +450,15 @@ def write_titles(splitter, filename):
 	if fp != sys.stdout:
 		fp.close()
 
-def main():
-	options = parse_args()
-	if not process_options(options):
-		sys.exit(1)
-
-	cuepath = to_unicode(options.cuefile)
-	if os.path.isdir(cuepath):
-		cuepath = find_cuefile(cuepath)
-		if options.dry_run:
-			debug("use cue file %s", quote(cuepath))
+def read_cue(cuepath, options, index):
+	cuesheet = index.get_cue(cuepath, options.coding)
+	if cuesheet is not None:
+		return cuesheet
 
-	cuesheet = None
-	cue_error = lambda line, msg: printerr("%s:%d: %s\n", cuepath, line, msg)
+	errors = []
+	def cue_error(line, msg):
+		errors.append(line)
+		printerr("%s:%d: %s\n", cuepath, line, msg)
 
 	try:
 		cuesheet = cue.read(cuepath, options.coding, cue_error, options.ignore)
@@ -349,13 +475,23 @@ def main():
 		if not cuesheet:
 			sys.exit(1)
 
+	# sheets with errors are parsed again, so that they are reported
+	if not errors:
+		index.put_cue(cuepath, options.coding, cuesheet)
+
+	return cuesheet
+
+def process_cue(cuepath, options):
+	index = open_index(options.index)
+
+	cuesheet = read_cue(cuepath, options, index)
 	cuesheet.dir = os.path.dirname(cuepath)
 
 	if options.dump == "cue":
-		print_cue(cuesheet)
+		print_cue(cuesheet, index)
 		return 0
 
-	splitter = Splitter(cuesheet, options)
+	splitter = Splitter(cuesheet, options, index)
 
 	if options.export_titles != None:
 		write_titles(splitter, options.export_titles)
@@ -364,11 +500,104 @@ def main():
 	switch(options.dump, {
 		"tags":		lambda: splitter.dump_tags(),
 		"tracks":	lambda: splitter.dump_tracks(),
+		"checksums":	lambda: splitter.dump_checksums(),
 		None:		lambda: splitter.split()
 	})
 
 	return 0
 
+def init_worker():
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+	# the status line belongs to the parent process
+	tools.board = None
+
+def split_album(job):
+	cuepath, options = job
+
+	stdout, stderr = sys.stdout, sys.stderr
+	sys.stdout, sys.stderr = StringIO(), StringIO()
+
+	try:
+		status = process_cue(cuepath, options)
+	except SystemExit as exc:
+		status = exc.code
+	except Exception as exc:
+		printerr("%s (%s)", exc, exc.__class__.__name__)
+		status = 1
+	finally:
+		out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+		sys.stdout, sys.stderr = stdout, stderr
+
+	return cuepath, not status, out, err
+
+def split_batch(root, options):
+	if not os.path.isdir(root):
+		fatal("%s: not a directory", quote(root))
+
+	albums = []
+	for cuepath in find_cuefiles(root):
+		opt = copy.copy(options)
+		subdir = os.path.relpath(os.path.dirname(cuepath), root)
+
+		opt.dir = os.path.normpath(os.path.join(options.dir, subdir))
+		opt.show_progress = False
+		opt.jobs = 1
+
+		albums.append((cuepath, opt))
+
+	if not albums:
+		fatal("no cue file")
+
+	if options.show_progress:
+		tools.board = ProgressBoard(len(albums), unit="albums")
+
+	pool = multiprocessing.Pool(options.jobs, init_worker)
+
+	failed = []
+	for cuepath, ok, out, err in pool.imap_unordered(split_album, albums):
+		if out:
+			printf("%s", out)
+		sys.stderr.write(err)
+
+		if not ok:
+			failed.append(cuepath)
+
+		if tools.board is not None:
+			tools.board.update(1)
+
+	pool.close()
+	pool.join()
+
+	if tools.board is not None:
+		tools.board.close()
+		tools.board = None
+
+	printf("\n")
+	for cuepath, _ in albums:
+		printf("%-6s %s\n", "FAILED" if cuepath in failed else "OK", quote(cuepath))
+
+	printf("%d albums: %d ok, %d failed\n",
+		len(albums), len(albums) - len(failed), len(failed))
+
+	return 1 if failed else 0
+
+def main():
+	options = parse_args()
+	if not process_options(options):
+		sys.exit(1)
+
+	cuepath = to_unicode(options.cuefile)
+	if options.batch:
+		return split_batch(cuepath, options)
+
+	if os.path.isdir(cuepath):
+		cuepath = find_cuefile(cuepath)
+		if options.dry_run:
+			debug("use cue file %s", quote(cuepath))
+
+	return process_cue(cuepath, options)
+
 if __name__ == '__main__':
 	signal.signal(signal.SIGINT, sigint_handler)
 	sys.exit(main())
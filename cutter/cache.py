@@ -0,0 +1,158 @@
+from . coding import to_unicode
+
+import threading
+import tempfile
+import hashlib
+import shutil
+import fcntl
+import json
+import os
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+CHECKSUM_SUFFIX = ".json"
+
+def clone_file(src, dst):
+	"""reflink src to dst where the filesystem supports it, copy otherwise"""
+
+	with open(src, "rb") as fsrc:
+		with open(dst, "wb") as fdst:
+			try:
+				fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+				return
+			except (IOError, OSError):
+				pass
+
+			shutil.copyfileobj(fsrc, fdst)
+
+class Cache:
+	"""encoded tracks stored by the hash of their source range and encoder"""
+
+	def __init__(self, dir, limit):
+		self.dir = os.path.expanduser(dir)
+		self.limit = limit
+		self.lock = threading.Lock()
+
+		# known once the directory is listed, other runs sharing the
+		# cache are noticed at the next eviction
+		self.size = None
+
+		if not os.path.exists(self.dir):
+			os.makedirs(self.dir)
+
+	@staticmethod
+	def source_id(path):
+		# hashing the contents would read a whole image before any lookup
+		st = os.stat(path)
+		return [to_unicode(os.path.realpath(path)), st.st_size, st.st_mtime]
+
+	def key(self, source, begin, end, encoder, command):
+		data = json.dumps([self.source_id(source), begin, end, encoder, command])
+		return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+	def entry_path(self, key):
+		return os.path.join(self.dir, key)
+
+	def checksum_path(self, key):
+		return self.entry_path(key) + CHECKSUM_SUFFIX
+
+	def fetch(self, key, path, required=()):
+		"""copy the entry of key to path, its checksums or None if missing
+
+		Entries without the `required` checksums are missing.
+		"""
+
+		entry = self.entry_path(key)
+
+		try:
+			with open(self.checksum_path(key)) as fp:
+				checksum = json.load(fp)
+		except (IOError, OSError, ValueError):
+			checksum = {}
+
+		if any(k not in checksum for k in required):
+			return None
+
+		try:
+			# the access time is unreliable (noatime), mtime orders the entries
+			os.utime(entry, None)
+			clone_file(entry, path)
+		except (IOError, OSError):
+			return None
+
+		return checksum
+
+	def write_checksum(self, key, checksum):
+		path = self.checksum_path(key)
+
+		if not checksum:
+			if os.path.exists(path):
+				os.remove(path)
+			return
+
+		fd, tmpname = tempfile.mkstemp(prefix=".tmp-", dir=self.dir)
+		try:
+			with os.fdopen(fd, "w") as fp:
+				json.dump(checksum, fp, sort_keys=True)
+			os.rename(tmpname, path)
+		except:
+			os.remove(tmpname)
+			raise
+
+	def store(self, key, path, checksum=None):
+		# written first, a stored entry always has its checksums
+		self.write_checksum(key, checksum)
+
+		fd, tmpname = tempfile.mkstemp(prefix=".tmp-", dir=self.dir)
+		os.close(fd)
+
+		entry = self.entry_path(key)
+		try:
+			replaced = os.path.getsize(entry)
+		except OSError:
+			replaced = 0
+
+		try:
+			clone_file(path, tmpname)
+			size = os.path.getsize(tmpname)
+			os.rename(tmpname, entry)
+		except:
+			os.remove(tmpname)
+			raise
+
+		with self.lock:
+			if self.size is not None:
+				self.size += size - replaced
+
+			if self.size is None or self.size > self.limit:
+				self.evict()
+
+	def evict(self):
+		entries = []
+		for name in os.listdir(self.dir):
+			if name.startswith(".") or name.endswith(CHECKSUM_SUFFIX):
+				continue
+
+			try:
+				st = os.stat(os.path.join(self.dir, name))
+			except OSError:
+				continue
+
+			entries.append((st.st_mtime, st.st_size, name))
+
+		total = sum([size for _, size, _ in entries])
+
+		for _, size, name in sorted(entries):
+			if total <= self.limit:
+				break
+
+			for path in (self.entry_path(name), self.checksum_path(name)):
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+
+			total -= size
+
+		self.size = total
@@ -0,0 +1,29 @@
+import hashlib
+import zlib
+
+class Checksum:
+	"""crc32 and md5 of pcm data, updated while it is streamed"""
+
+	def __init__(self):
+		self.crc = 0
+		self.md5 = hashlib.md5()
+
+	def update(self, data):
+		self.crc = zlib.crc32(data, self.crc)
+		self.md5.update(data)
+
+	def result(self):
+		return {
+			"crc32": "%08x" % (self.crc & 0xffffffff),
+			"md5": self.md5.hexdigest(),
+		}
+
+def stream_checksum(reader, chunk_size=0x4000):
+	checksum = Checksum()
+
+	data = reader.read(chunk_size)
+	while len(data):
+		checksum.update(data)
+		data = reader.read(chunk_size)
+
+	return checksum.result()
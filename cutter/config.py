@@ -24,9 +24,59 @@ use_tempdir = false
 # show progress in percents
 progress = false
 
+# record finished tracks in the output directory,
+# so that an interrupted split skips them when run again
+manifest = false
+
+# compute crc32 and md5 of the audio of each track
+# and keep them in the manifest for later verification
+checksum = false
+
+# compute accuraterip v1/v2 and ctdb checksums of the tracks (needs numpy)
+accuraterip = false
+
+# number of tracks to encode at once
+jobs = 1
+
+# how parallel jobs are run: in threads, or from one asyncio event loop
+# which drives all decoder and encoder processes
+# engine = <thread | asyncio>
+
+# memory (in megabytes) for decoded audio shared by parallel jobs
+buffer_size = 64
+
+# decode non-seekable sources (ape, flac, ...) to a temporary file once,
+# so that parallel jobs can read their tracks from it in any order
+spill = false
+
+# where to place decoded temporary files (tmpfs keeps them in memory)
+# spill_dir = /dev/shm
+
+# keep encoded tracks here and reuse them when the same source range
+# is encoded with the same settings again
+# cache_dir = ~/.cache/cutter
+
+# size limit of the cache in megabytes
+cache_size = 1024
+
+# keep parsed cue sheets and the stream parameters of audio files in
+# this database, entries are checked by file size and modification time
+# index = ~/.cache/cutter/index.db
+
 [encoding]
 # type = <default format type>
 
+# encode with sox or with the native encoders (flac, oggenc, lame)
+# when no sample format conversion is needed
+# backend = <sox | native>
+
+# size (in kilobytes) of the chunks of audio written to the encoder
+# chunk_size = 256
+
+# space (in bytes) reserved in rewritten tags, so that later retags
+# are written in place
+# tag_padding =
+
 [output]
 # sample_rate =
 # channels =
@@ -91,8 +141,22 @@ if not cfg.read(os.path.expanduser(CONFIG_FILE_PATH)):
 DIR			= cfg.get("general", "dir", ".")
 USE_TEMPDIR		= cfg.getbool("general", "use_tempdir")
 PROGRESS		= cfg.getbool("general", "progress")
+MANIFEST		= cfg.getbool("general", "manifest", False)
+CHECKSUM		= cfg.getbool("general", "checksum", False)
+ACCURATERIP		= cfg.getbool("general", "accuraterip", False)
+JOBS			= cfg.getint("general", "jobs")
+ENGINE			= cfg.get("general", "engine")
+BUFFER_SIZE		= cfg.getint("general", "buffer_size")
+SPILL			= cfg.getbool("general", "spill", False)
+SPILL_DIR		= cfg.get("general", "spill_dir")
+CACHE_DIR		= cfg.get("general", "cache_dir")
+CACHE_SIZE		= cfg.getint("general", "cache_size")
+INDEX			= cfg.get("general", "index")
 
 TYPE			= cfg.get("encoding", "type")
+BACKEND			= cfg.get("encoding", "backend")
+TAG_PADDING		= cfg.getint("encoding", "tag_padding")
+CHUNK_SIZE		= cfg.getint("encoding", "chunk_size")
 
 SAMPLE_RATE		= cfg.getint("output", "sample_rate")
 CHANNELS		= cfg.getint("output", "channels")
@@ -1,4 +1,3 @@
-import itertools
 import codecs
 import sys
 import re
@@ -67,6 +66,7 @@ class Cue:
 	def __init__(self):
 		self._attrs = {}
 		self._files = []
+		self.coding = None
 
 	def attrs(self):
 		return sorted(self._attrs.items())
@@ -99,125 +99,85 @@ class Context:
 		FILE
 	) = range(3)
 
-def check(count = None, context = None):
-	def deco(func):
-		def method(cls, *lst):
-			if count is not None:
-				n = len(lst)
-				if n != count:
-					raise InvalidCommand(
-						"%d arg%s expected, got %d" %
-						(count, "s" if count > 1 else "", n)
-					)
-			if context is not None:
-				if type(context) in (list, tuple):
-					if cls.context not in context:
-						raise InvalidContext
-				elif cls.context != context:
-					raise InvalidContext
-			func(cls, *lst)
-		return method
-	return deco
+re_timestamp = re.compile(r"^[\d]{1,3}:[\d]{1,2}:[\d]{1,2}$")
+
+def parse_timestamp(time):
+	if not re_timestamp.match(time):
+		raise InvalidCommand("invalid timestamp '%s'" % time)
+
+	m, s, f = map(int, time.split(":"))
+	return (m * 60 + s) * 75 + f
 
 class CueParser:
-	re_timestamp = re.compile("^[\d]{1,3}:[\d]{1,2}:[\d]{1,2}$")
+	re_arg = re.compile(r"""(?:[^\s"']|"[^"]*"|'[^']*')+""", re.U)
+	re_args = re.compile(r"""\s*(?:(?:[^\s"']|"[^"]*"|'[^']*')+(?:\s+|$))*$""", re.U)
+	re_quoted = re.compile(r""""([^"]*)"|'([^']*)'""")
 	rem_commands = ('genre', 'date', 'comment')
 
 	def __init__(self):
-		def do_set_attr(name, cue = False, track = False, convert = None):
-			def func(*args):
-				n = len(args)
-				if n != 1:
-					raise InvalidCommand("1 arg expected, got %d" % n)
-				opt = {}
-				if cue:
-					opt[Context.GENERAL] = self.cue
-				if track:
-					opt[Context.TRACK] = self.track
-
-				arg = convert(args[0]) if convert else args[0]
-				self.set_attr(name, arg, opt)
-			return func
-
 		self.cue = Cue()
 		self.context = Context.GENERAL
 		self.track = None
 		self.file = None
 
-		self.commands = {
-			"file": 	self.parse_file,
-			"flags": 	self.parse_flags,
-			"index": 	self.parse_index,
-			"pregap": 	self.parse_pregap,
-			"rem":		self.parse_rem,
-			"track": 	self.parse_track,
-
-			"catalog":	do_set_attr("catalog", cue = True),
-			"performer":	do_set_attr("performer", cue = True, track = True),
-			"postgap": 	do_set_attr("postgap", track = True, convert = self.parse_timestamp),
-			"songwriter":	do_set_attr("songwriter", cue = True, track = True),
-			"title": 	do_set_attr("title", cue = True, track = True),
-
-			"cdtextfile":	self.parse_skip,
-			"isrc":		self.parse_skip,
-		}
+	@staticmethod
+	def unquote(match):
+		value = match.group(1)
+		return value if value is not None else match.group(2)
 
 	@staticmethod
-	def split_args(args):
-		lst = []
+	def unclosed_quote(args):
 		quote = None
-		cur = []
-
-		def push():
-			lst.append("".join(cur).strip())
-			cur[:] = []
-
 		for ch in args:
 			if quote:
-				if ch != quote:
-					cur.append(ch)
-				else:
+				if ch == quote:
 					quote = None
-			elif ch.isspace():
-				if cur:
-					push()
 			elif ch in ("\"", "'"):
 				quote = ch
-			else:
-				cur.append(ch)
 
-		if quote:
-			raise CueParserError("unclosed quote '%s'" % quote)
+		return quote
 
-		if cur:
-			push()
+	@staticmethod
+	def split_args(args):
+		if "\"" not in args and "'" not in args:
+			return args.split()
 
-		return lst
+		# a single quoted argument, the most common case
+		if args[0] == args[-1] == "\"" and args.count("\"") == 2:
+			arg = args[1:-1]
+			return [arg.strip()] if arg else []
 
-	@staticmethod
-	def parse_timestamp(time):
-		if not CueParser.re_timestamp.match(time):
-			raise InvalidCommand("invalid timestamp '%s'" % time)
+		if not CueParser.re_args.match(args):
+			raise CueParserError("unclosed quote '%s'" % CueParser.unclosed_quote(args))
 
-		m, s, f = map(int, time.split(":"))
-		return (m * 60 + s) * 75 + f
+		lst = []
+		for arg in CueParser.re_arg.findall(args):
+			if "\"" in arg or "'" in arg:
+				arg = CueParser.re_quoted.sub(CueParser.unquote, arg)
+				if not arg:
+					continue
+				arg = arg.strip()
+
+			lst.append(arg)
+
+		return lst
 
 	def get_cue(self):
 		return self.cue
 
-	@check(2)
+	def attr_owner(self):
+		return self.cue if self.context == Context.GENERAL else self.track
+
 	def parse_file(self, *args):
 		self.file = File(*args)
 		self.cue.add_file(self.file)
 		self.context = Context.FILE
 
-	@check(2, (Context.FILE, Context.TRACK))
 	def parse_track(self, *args):
 		self.track = Track(*args)
 		self.file.add_track(self.track)
 		self.context = Context.TRACK
 
-	@check(2, Context.TRACK)
 	def parse_index(self, number, time):
 		if "postgap" in self.track._attrs:
 			raise InvalidCommand("after POSTGAP")
@@ -225,42 +185,54 @@ class CueParser:
 			number = int(number)
 		except ValueError:
 			raise InvalidCommand("invalid number '%s'" % number)
-		if number is 0 and "pregap" in self.track._attrs:
+		if number == 0 and "pregap" in self.track._attrs:
 			raise InvalidCommand("conflict with previous PREGAP")
 		if number in self.track._indexes:
-		 	raise InvalidCommand("duplicate index number %d" % number)
+			raise InvalidCommand("duplicate index number %d" % number)
 
-		self.track._indexes[number] = self.parse_timestamp(time)
+		self.track._indexes[number] = parse_timestamp(time)
 
-	@check(1, Context.TRACK)
 	def parse_pregap(self, time):
 		if self.track._indexes:
 			raise InvalidCommand("must appear before any INDEX commands for the current track")
-		self.set_attr("pregap", self.parse_timestamp(time), obj = self.track)
+		self.set_attr("pregap", parse_timestamp(time), self.track)
 
-	def set_attr(self, attr, value, opt = None, obj = None):
-		if opt is not None:
-			obj = opt.get(self.context)
-			if obj is None:
-				raise InvalidContext
-		elif obj is None:
-			raise CueParserError("CueParserError.set_attr: invalid usage")
+	def parse_postgap(self, time):
+		# an invalid timestamp is reported before an invalid context
+		value = parse_timestamp(time)
+		if self.context != Context.TRACK:
+			raise InvalidContext
+		self.set_attr("postgap", value, self.track)
 
-		if attr in obj._attrs:
-			raise InvalidCommand("duplicate")
+	def parse_catalog(self, value):
+		self.set_attr("catalog", value, self.cue)
 
-		obj._attrs[attr] = value
+	def parse_performer(self, value):
+		self.set_attr("performer", value, self.attr_owner())
+
+	def parse_songwriter(self, value):
+		self.set_attr("songwriter", value, self.attr_owner())
+
+	def parse_title(self, value):
+		self.set_attr("title", value, self.attr_owner())
 
-	@check(context = Context.TRACK)
 	def parse_flags(self, *flags):
 		if self.track._indexes:
 			raise InvalidCommand("must appear before any INDEX commands")
 
-	def parse_rem(self, opt, *args):
-		cmd = opt.lower()
-		if len(args) and cmd in self.rem_commands:
-			value = " ".join(args)
-			self.set_attr(cmd, value, obj = self.cue)
+	def parse_rem(self, *args):
+		if len(args) < 2:
+			return
+
+		cmd = args[0].lower()
+		if cmd in self.rem_commands:
+			self.set_attr(cmd, " ".join(args[1:]), self.cue)
+
+	def set_attr(self, attr, value, obj):
+		if attr in obj._attrs:
+			raise InvalidCommand("duplicate")
+
+		obj._attrs[attr] = value
 
 	def parse_skip(self, *args):
 		pass
@@ -268,8 +240,41 @@ class CueParser:
 	def parse_default(self, *args):
 		raise UnknownCommand
 
+	# command: (handler, number of args, allowed contexts)
+	commands = {
+		"file": 	(parse_file, 2, None),
+		"flags": 	(parse_flags, None, (Context.TRACK,)),
+		"index": 	(parse_index, 2, (Context.TRACK,)),
+		"pregap": 	(parse_pregap, 1, (Context.TRACK,)),
+		"rem":		(parse_rem, None, None),
+		"track": 	(parse_track, 2, (Context.FILE, Context.TRACK)),
+
+		"catalog":	(parse_catalog, 1, (Context.GENERAL,)),
+		"performer":	(parse_performer, 1, (Context.GENERAL, Context.TRACK)),
+		"postgap": 	(parse_postgap, 1, None),
+		"songwriter":	(parse_songwriter, 1, (Context.GENERAL, Context.TRACK)),
+		"title": 	(parse_title, 1, (Context.GENERAL, Context.TRACK)),
+
+		"cdtextfile":	(parse_skip, None, None),
+		"isrc":		(parse_skip, None, None),
+	}
+
+	unknown = (parse_default, None, None)
+
 	def parse(self, cmd, arg):
-		self.commands.get(cmd.lower(), self.parse_default)(*self.split_args(arg))
+		args = self.split_args(arg)
+		func, count, contexts = self.commands.get(cmd.lower(), self.unknown)
+
+		if count is not None and len(args) != count:
+			raise InvalidCommand(
+				"%d arg%s expected, got %d" %
+				(count, "s" if count > 1 else "", len(args))
+			)
+
+		if contexts is not None and self.context not in contexts:
+			raise InvalidContext
+
+		func(self, *args)
 
 	def calc_offsets(self):
 		for file in self.cue._files:
@@ -304,9 +309,10 @@ def __read_file(filename, coding = None):
 	f.close()
 
 	if coding:
-		return data.decode(coding)
+		return data.decode(coding), coding
 
 	encoded = None
+	encoding = "utf-8"
 	try:
 		encoded = data.decode("utf-8-sig")
 	except UnicodeDecodeError:
@@ -326,23 +332,30 @@ def __read_file(filename, coding = None):
 		except Exception as exc:
 			raise Exception("decoding failed: %s" % exc)
 
-	return encoded
+	return encoded, encoding
 
 def read(filename, coding=None, error_handler=None, ignore_errors=False):
 	def report(fmt, *args):
 		if error_handler:
 			error_handler(lineno, fmt % args)
 
-	def parse_line(line):
+	cuefile, encoding = __read_file(filename, coding)
+	parser = CueParser()
+	parser.cue.coding = encoding
+
+	for lineno, line in enumerate(cuefile.split("\n"), 1):
 		data = line.split(None, 1)
+		if not data:
+			continue
+
 		cmd = data[0]
 
-		if len(data) is 1:
+		if len(data) == 1:
 			report("invalid command '%s': arg missed", cmd)
 		else:
 			try:
-				parser.parse(*data)
-				return True
+				parser.parse(cmd, data[1].rstrip())
+				continue
 			except UnknownCommand:
 				report("unknown command '%s'", cmd)
 			except InvalidContext:
@@ -352,15 +365,52 @@ def read(filename, coding=None, error_handler=None, ignore_errors=False):
 			except CueParserError as err:
 				report("%s", err)
 
-		return False
-
-	cuefile = __read_file(filename, coding)
-	parser = CueParser()
-
-	for line, lineno in zip(cuefile.split("\n"), itertools.count(1)):
-		line = line.strip()
-		if line and not parse_line(line) and not ignore_errors:
+		if not ignore_errors:
 			return None
 
 	parser.calc_offsets()
 	return parser.get_cue()
+
+def serialize(cue):
+	"""the parsed cue as json compatible data"""
+
+	def track_data(track):
+		return {
+			"number": track.number,
+			"type": track.type,
+			"attrs": track._attrs,
+			"indexes": sorted(track._indexes.items()),
+			"begin": track.begin,
+			"end": track.end,
+		}
+
+	return {
+		"coding": cue.coding,
+		"attrs": cue._attrs,
+		"files": [{
+			"name": file.name,
+			"type": file.type,
+			"tracks": [track_data(track) for track in file._tracks],
+		} for file in cue._files],
+	}
+
+def deserialize(data):
+	cue = Cue()
+	cue.coding = data["coding"]
+	cue._attrs = data["attrs"]
+
+	for entry in data["files"]:
+		file = File(entry["name"], entry["type"])
+
+		for item in entry["tracks"]:
+			track = Track(item["number"], item["type"])
+			track._attrs = item["attrs"]
+			track._indexes = dict(item["indexes"])
+			track.begin = item["begin"]
+			track.end = item["end"]
+
+			file.add_track(track)
+
+		cue.add_file(file)
+
+	return cue
@@ -0,0 +1,455 @@
+"""asyncio engine driving decoder and encoder processes from one thread
+
+Requires python 3.5, the module is only imported when it is selected.
+"""
+
+from . formats import wavfile
+from . coding import to_unicode
+from . tools import quote
+
+import asyncio
+import struct
+import time
+
+CHUNK_SIZE = 0x10000
+QUEUE_SIZE = 16
+
+class EngineError(Exception):
+	pass
+
+async def read_wav_header(stream):
+	"""read a wav header from a pipe, returns (channels, width, rate, nframes)"""
+
+	try:
+		hdr = await stream.readexactly(12)
+		if hdr[:4] != b"RIFF" or hdr[8:12] != b"WAVE":
+			raise EngineError("file does not start with RIFF/WAVE id")
+
+		params = None
+		while True:
+			name, length = struct.unpack("<4sI", await stream.readexactly(8))
+
+			if name == b"data":
+				if params is None:
+					raise EngineError("data chunk before fmt chunk")
+
+				channels, width, rate = params
+				return channels, width, rate, length // (channels * width)
+
+			data = await stream.readexactly(length + (length & 1))
+			if name == b"fmt ":
+				if length < 16:
+					raise EngineError("fmt chunk is too short")
+
+				_, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data)
+				params = channels, (bits + 7) // 8, rate
+	except asyncio.IncompleteReadError:
+		raise EngineError("unexpected end of wav header")
+
+async def read_chunk(stream, size):
+	"""read size bytes, less only at the end of the stream"""
+
+	try:
+		return await stream.readexactly(size)
+	except asyncio.IncompleteReadError as err:
+		return err.partial
+
+class Process:
+	"""subprocess with its stderr collected in the background"""
+
+	def __init__(self, args):
+		self.args = args
+		self.proc = None
+		self.stderr = None
+
+		self.status = None
+		self.status_msg = ""
+
+	async def start(self, stdin=None, stdout=None):
+		try:
+			self.proc = await asyncio.create_subprocess_exec(*self.args,
+				stdin=stdin, stdout=stdout, stderr=asyncio.subprocess.PIPE)
+		except OSError as err:
+			self.status = "not started"
+			self.status_msg = err.strerror
+			return False
+
+		self.stderr = asyncio.ensure_future(self.proc.stderr.read())
+		return True
+
+	async def wait(self):
+		if self.proc is None:
+			return self.status
+
+		status = await self.proc.wait()
+		msg = await self.stderr
+
+		if status:
+			self.status = status if status > 0 else "signal %d" % -status
+			self.status_msg = to_unicode(msg)
+
+		return self.status
+
+	def describe(self):
+		return " ".join(map(quote, self.args))
+
+class MapSource:
+	"""frames of a wav file, read through a memory map"""
+
+	def __init__(self, path, begin, nframes):
+		self.path = path
+		self.begin = begin
+		self.nframes = nframes
+		self.reader = None
+		self.error = None
+
+	async def open(self):
+		self.reader = wavfile.WavFile(self.path)
+		self.reader.setpos(min(self.begin, self.reader.getnframes()))
+		self.frame_size = self.reader.getnchannels() * self.reader.getsampwidth()
+
+	async def read(self, size):
+		nframes = min(size // self.frame_size, self.nframes)
+		self.nframes -= nframes
+
+		return self.reader.readframes(nframes)
+
+	def describe(self):
+		return self.path
+
+	def close(self):
+		if self.reader is not None:
+			self.reader.close()
+
+class PipeSource:
+	"""frames decoded by a process of their own"""
+
+	def __init__(self, args, nframes):
+		self.proc = Process(args)
+		self.nframes = nframes
+		self.error = None
+		self.finished = False
+
+	async def open(self):
+		if not await self.proc.start(stdout=asyncio.subprocess.PIPE):
+			raise EngineError("decoder is not started: %s" % self.proc.status_msg)
+
+		channels, width, _, _ = await read_wav_header(self.proc.proc.stdout)
+		self.frame_size = channels * width
+
+	async def read(self, size):
+		stdout = self.proc.proc.stdout
+
+		size = min(size // self.frame_size, self.nframes) * self.frame_size
+		data = await read_chunk(stdout, size) if size else b""
+
+		self.nframes -= len(data) // self.frame_size
+		if not len(data):
+			await self.finish()
+
+		return data
+
+	async def finish(self):
+		if self.finished:
+			return
+
+		self.finished = True
+
+		# the decoder may write past the range (padding)
+		await self.proc.proc.stdout.read()
+
+		if await self.proc.wait():
+			self.error = "decode failed (%s): %s" % (self.proc.status, self.proc.status_msg)
+		elif self.nframes:
+			self.error = "unexpected end of stream"
+
+	def describe(self):
+		return self.proc.describe()
+
+	def close(self):
+		pass
+
+class QueueSource:
+	"""frames of one track of a SharedDecoder"""
+
+	def __init__(self, decoder, begin, nframes):
+		self.decoder = decoder
+		self.begin = begin
+		self.nframes = nframes
+		self.queue = None
+		self.buffered = b""
+		self.error = None
+		self.done = False
+
+	async def open(self):
+		pass
+
+	async def read(self, size):
+		if not len(self.buffered):
+			data = await self.queue.get()
+			if data is None:
+				self.error = self.decoder.error
+				return b""
+
+			self.buffered = data
+
+		data, self.buffered = self.buffered[:size], self.buffered[size:]
+		return data
+
+	def describe(self):
+		return self.decoder.proc.describe()
+
+	def close(self):
+		pass
+
+class SharedDecoder:
+	"""one decoder process whose output is split between tracks in order"""
+
+	def __init__(self, args):
+		self.proc = Process(args)
+		self.sources = []
+		self.error = None
+
+	def source(self, begin, nframes):
+		src = QueueSource(self, begin, nframes)
+		self.sources.append(src)
+		return src
+
+	def open_queues(self):
+		# before python 3.10 a queue is bound to the loop current at its
+		# creation, the loop of the engine is only running now
+		for src in self.sources:
+			src.queue = asyncio.Queue(QUEUE_SIZE)
+
+	async def feed(self, stdout, frame_size):
+		pos = 0
+
+		for src in self.sources:
+			skip = (src.begin - pos) * frame_size
+			while skip > 0:
+				data = await read_chunk(stdout, min(skip, CHUNK_SIZE))
+				if not len(data):
+					raise EngineError("unexpected end of stream")
+				skip -= len(data)
+
+			left = src.nframes * frame_size
+			while left > 0:
+				data = await read_chunk(stdout, min(left, CHUNK_SIZE))
+				if not len(data):
+					raise EngineError("unexpected end of stream")
+
+				await src.queue.put(data)
+				left -= len(data)
+
+			await src.queue.put(None)
+			src.done = True
+			pos = src.begin + src.nframes
+
+	async def run(self):
+		try:
+			if not await self.proc.start(stdout=asyncio.subprocess.PIPE):
+				raise EngineError("decoder is not started: %s" % self.proc.status_msg)
+
+			channels, width, _, _ = await read_wav_header(self.proc.proc.stdout)
+			await self.feed(self.proc.proc.stdout, channels * width)
+		except EngineError as err:
+			self.error = str(err)
+
+		for src in self.sources:
+			if not src.done:
+				await src.queue.put(None)
+
+		if self.proc.proc is None:
+			return
+
+		# the rest of the stream is not needed
+		if self.proc.proc.returncode is None:
+			try:
+				self.proc.proc.terminate()
+			except ProcessLookupError:
+				pass
+
+		# the process is not reaped until its pipes are closed
+		while len(await self.proc.proc.stdout.read(CHUNK_SIZE)):
+			pass
+
+		await self.proc.wait()
+
+class Job:
+	"""one track: its source, encoder command and output path"""
+
+	def __init__(self, source, path, args, params, nframes):
+		self.source = source
+		self.path = path
+		self.args = args
+		self.params = params
+		self.nframes = nframes
+
+		self.hooks = []
+		self.progress = None
+		self.elapsed = 0
+		self.written = 0
+
+		self.proc = Process(args) if args is not None else None
+		self.stage = None
+		self.status = None
+		self.status_msg = ""
+
+	def describe(self):
+		if self.stage == "decode":
+			return self.source.describe()
+
+		return self.proc.describe() if self.proc is not None else self.path
+
+	def get_status(self):
+		return self.status, self.status_msg
+
+	def header(self, nframes):
+		channels, width, rate = self.params
+		return wavfile.header(channels, width, rate, nframes)
+
+	def fail(self, stage, status, msg):
+		if self.status is None:
+			self.stage = stage
+			self.status = status
+			self.status_msg = msg
+
+class AsyncEngine:
+	def __init__(self, jobs):
+		self.jobs = jobs
+
+	async def pump(self, job, write):
+		broken = write is None
+
+		while True:
+			data = await job.source.read(CHUNK_SIZE)
+			if not len(data):
+				break
+
+			for hook in job.hooks:
+				hook(data)
+
+			if job.progress is not None:
+				job.progress.update(len(data))
+
+			job.written += len(data)
+
+			# the source is drained anyway, a shared decoder waits for it
+			if not broken:
+				try:
+					await write(data)
+				except (BrokenPipeError, ConnectionResetError):
+					broken = True
+
+		if job.source.error is not None:
+			job.fail("decode", "error", job.source.error)
+
+	async def encode(self, job):
+		if not await job.proc.start(stdin=asyncio.subprocess.PIPE):
+			job.fail("encode", job.proc.status, job.proc.status_msg)
+			await self.pump(job, None)
+			return
+
+		stdin = job.proc.proc.stdin
+
+		async def write(data):
+			stdin.write(data)
+			await stdin.drain()
+
+		try:
+			await write(job.header(job.nframes))
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+
+		await self.pump(job, write)
+
+		try:
+			stdin.close()
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+
+		if await job.proc.wait():
+			job.fail("encode", job.proc.status, job.proc.status_msg)
+
+	async def write_file(self, job):
+		try:
+			fp = open(job.path, "wb")
+		except IOError as err:
+			job.fail("encode", "not started", err.strerror)
+			await self.pump(job, None)
+			return
+
+		with fp:
+			fp.write(job.header(job.nframes))
+
+			async def write(data):
+				fp.write(data)
+
+			await self.pump(job, write)
+
+			if job.written & 1:
+				fp.write(b"\x00")
+
+			channels, width, _ = job.params
+			if job.written != job.nframes * channels * width:
+				fp.seek(0)
+				fp.write(job.header(job.written // (channels * width)))
+
+	async def run_job(self, semaphore, job, done):
+		async with semaphore:
+			start = time.time()
+
+			try:
+				await job.source.open()
+			except (EngineError, IOError, OSError) as err:
+				job.fail("decode", "error", str(err))
+
+			if job.status is None:
+				if job.progress is not None:
+					channels, width, _ = job.params
+					job.progress.init(job.nframes * channels * width)
+
+				if job.proc is not None:
+					await self.encode(job)
+				else:
+					await self.write_file(job)
+
+				if job.progress is not None:
+					job.progress.finish()
+
+			job.source.close()
+			job.elapsed = time.time() - start
+
+		# tagging, caching and hashing block, the loop goes on draining
+		# the pipes of the other jobs meanwhile
+		await asyncio.get_event_loop().run_in_executor(None, done, job)
+
+	async def run_blocking(self, semaphore, func):
+		async with semaphore:
+			await asyncio.get_event_loop().run_in_executor(None, func)
+
+	async def run_jobs(self, jobs, decoders, done, blocking):
+		semaphore = asyncio.Semaphore(self.jobs)
+
+		for decoder in decoders:
+			decoder.open_queues()
+
+		tasks = [asyncio.ensure_future(d.run()) for d in decoders]
+		tasks.extend([self.run_job(semaphore, job, done) for job in jobs])
+		tasks.extend([self.run_blocking(semaphore, func) for func in blocking])
+
+		await asyncio.gather(*tasks)
+
+	def run(self, jobs, decoders, done, blocking=()):
+		"""run the jobs, done(job) after each, and the blocking calls in
+		threads, all within the same limit of parallel jobs
+		"""
+
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+
+		try:
+			loop.run_until_complete(self.run_jobs(jobs, decoders, done, blocking))
+		finally:
+			asyncio.set_event_loop(None)
+			loop.close()
@@ -41,10 +41,26 @@ def decoder(name):
 
 	return DecoderHandler(handler_type())
 
+def file_decoder(filename):
+	return decoder(filename.rpartition(".")[-1].lower())
+
 def decoder_open(filename, *args, **kwargs):
-	ext = filename.rpartition(".")[-1].lower()
-	handler = decoder(ext)
+	handler = file_decoder(filename)
 	if handler is None:
 		return None
 
 	return handler.open(filename, *args, **kwargs)
+
+def probe(filename):
+	"""stream parameters read from the file headers, None if unknown"""
+
+	handler = file_decoder(filename)
+	if handler is None:
+		return None
+
+	return handler.probe(filename)
+
+def is_range_supported(filename):
+	handler = file_decoder(filename)
+
+	return handler is not None and handler.is_range_supported()
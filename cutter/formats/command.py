@@ -25,7 +25,8 @@ class Command:
 
 		try:
 			self.proc = subprocess.Popen(args,
-				stdin=stdin, stdout=stdout, stderr=stderr)
+				stdin=stdin, stdout=stdout, stderr=stderr,
+				close_fds=True)
 		except OSError as err:
 			self.status = "not started"
 			self.status_msg = err.strerror
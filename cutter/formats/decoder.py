@@ -1,16 +1,47 @@
 from . handler import *
 from . command import *
 
+from . wavfile import WavFile, WavStream
+from . probe import probe
 from .. tools import quote
 from .. coding import to_unicode
 
+import tempfile
+import errno
 import wave
+import os
 
 class DecoderError(Exception):
 	pass
 
+def copy_range(src, offset, dst, count):
+	"""copy count bytes from offset of src to dst in the kernel"""
+
+	copied = 0
+	use_copy_file_range = hasattr(os, "copy_file_range")
+
+	while copied < count:
+		n = 0
+		if use_copy_file_range:
+			try:
+				n = os.copy_file_range(src, dst, count - copied, offset + copied)
+			except OSError as err:
+				if err.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+					raise
+				use_copy_file_range = False
+
+		if not use_copy_file_range:
+			n = os.sendfile(dst, src, offset + copied, count - copied)
+
+		if n == 0:
+			break
+
+		copied += n
+
+	return copied
+
 class StreamInfo:
-	pass
+	total_samples = None
 
 class BaseDecoder:
 	class Reader:
@@ -20,6 +51,9 @@ class BaseDecoder:
 			self.bytes_per_frame = stream._channels * stream._bytes_per_sample
 			self.nread = 0
 
+			# functions called with every chunk of data read
+			self.hooks = []
+
 		def info(self):
 			return self.stream.info()
 
@@ -43,20 +77,74 @@ class BaseDecoder:
 			count = len(data) // self.bytes_per_frame
 			self.nread += count
 
+			for hook in self.hooks:
+				hook(data)
+
 			return data
 
+		def is_mapped(self):
+			"""read() returns views of a mapped file"""
+			return isinstance(self.stream.reader, WavFile)
+
+		def readinto(self, buf):
+			"""read frames into a preallocated buffer, returns the size read"""
+
+			avail = self.nframes - self.nread
+			nframes = min(len(buf) // self.bytes_per_frame, avail)
+			if nframes <= 0:
+				return 0
+
+			view = memoryview(buf)[:nframes * self.bytes_per_frame]
+			nbytes = self.stream.reader.readinto(view)
+			self.nread += nbytes // self.bytes_per_frame
+
+			for hook in self.hooks:
+				hook(view[:nbytes])
+
+			return nbytes
+
+		def sendto(self, fd, maxframes=None):
+			"""copy frames to fd bypassing python, None if not possible"""
+
+			reader = self.stream.reader
+			if not hasattr(reader, "fileno") or not hasattr(os, "sendfile"):
+				return None
+
+			if self.hooks:
+				return None
+
+			avail = max(self.nframes - self.nread, 0)
+			if maxframes and maxframes < avail:
+				avail = maxframes
+
+			nbytes = copy_range(reader.fileno(), reader.offset(), fd,
+				avail * self.bytes_per_frame)
+
+			count = nbytes // self.bytes_per_frame
+			reader.setpos(reader.tell() + count)
+			self.nread += count
+
+			return count
+
+	SPILL_BUFFER_SIZE=0x10000
+
+	seekable = False
+
 	def __init__(self, handler):
 		self.reader = None
 		self.handler = handler
 
+	def _open_reader(self, source):
+		return WavStream(source)
+
 	def _init_reader(self, source):
 		try:
-			self.reader = wave.open(source, "r")
+			self.reader = self._open_reader(source)
 		except Exception as exc:
 			self.close(True)
 
 			self.status = u"Exception"
-			self.status_msg = u"wave.open: %s" % exc
+			self.status_msg = u"%s: %s" % (exc.__class__.__name__, exc)
 			return
 
 		self._channels		= self.reader.getnchannels()
@@ -86,9 +174,12 @@ class BaseDecoder:
 		return info
 
 	def seek(self, pos):
-		nframes = pos * self._sample_rate // 75 - self.reader.tell()
+		frame = pos * self._sample_rate // 75
+		nframes = frame - self.reader.tell()
 
-		if nframes:
+		if nframes and self.seekable:
+			self.reader.setpos(min(frame, self.reader.getnframes()))
+		elif nframes:
 			r = self.Reader(self, nframes)
 			while len(r.read()):
 				pass
@@ -103,6 +194,29 @@ class BaseDecoder:
 
 		return self.Reader(self, nframes)
 
+	def spill(self, dir=None):
+		fd, path = tempfile.mkstemp(prefix="cutter-", suffix=".wav", dir=dir)
+		fp = os.fdopen(fd, "wb")
+
+		try:
+			reader = self.get_reader(None)
+			writer = wave.open(fp, "wb")
+			writer.setparams(reader.wave_params())
+
+			data = reader.read(self.SPILL_BUFFER_SIZE)
+			while len(data):
+				writer.writeframesraw(data)
+				data = reader.read(self.SPILL_BUFFER_SIZE)
+
+			writer.close()
+			fp.close()
+		except:
+			fp.close()
+			os.remove(path)
+			raise
+
+		return path
+
 	def describe(self):
 		return "-"
 
@@ -121,20 +235,32 @@ class BaseDecoder:
 		self.close()
 
 class WavDecoder(BaseDecoder):
-	def __init__(self, handler, filename, options=None):
+	seekable = True
+
+	def __init__(self, handler, filename, options=None, begin=None, end=None):
 		BaseDecoder.__init__(self, handler)
 
 		self.filename = filename
 		self._init_reader(filename)
 
+		if begin and self.ready():
+			self.reader.setpos(min(begin, self.reader.getnframes()))
+
+	def _open_reader(self, source):
+		return WavFile(source)
+
 	def describe(self):
 		return self.filename
 
 class AnyDecoder(BaseDecoder):
-	def __init__(self, handler, filename, options=None):
+	def __init__(self, handler, filename, options=None, begin=None, end=None):
 		BaseDecoder.__init__(self, handler)
 
-		args = self.handler.decode(filename)
+		if begin is None and end is None:
+			args = self.handler.decode(filename)
+		else:
+			args = self.handler.decode_range(filename, begin, end)
+
 		self.command = " ".join(map(quote, args))
 
 		self.proc = Command(args, stdout=PIPE, stderr=PIPE)
@@ -162,41 +288,89 @@ class AnyDecoder(BaseDecoder):
 			self.proc.stdout.close()
 			self.proc.close()
 
-class DummyDecoder:
-	class DummyReader(BaseDecoder.Reader):
-		def __init__(self, *args):
-			BaseDecoder.Reader.__init__(self, *args)
-
-		def info(self):
-			return self.stream.info()
+class DummyDecoder(BaseDecoder):
+	"""decoder of a dry run, knows the stream parameters and reads nothing"""
 
+	class DummyReader(BaseDecoder.Reader):
 		def read(self, *args):
 			return []
 
-	def __init__(self, orig):
-		self.orig = orig
+	def __init__(self, handler, info, command):
+		BaseDecoder.__init__(self, handler)
+
+		self._info = info
+		self.command = command
 
-	def __getattr__(self, attr):
-		return getattr(self.orig, attr)
+		self._channels		= info.channels
+		self._bytes_per_sample	= info.bits_per_sample // 8
+		self._sample_rate	= info.sample_rate
+
+	def ready(self):
+		return True
+
+	def info(self):
+		return self._info
 
 	def seek(self, *args):
 		pass
 
-	def get_reader(self, *args):
-		return self.DummyReader(self, *args)
+	def get_reader(self, npsecs):
+		if npsecs is None:
+			nframes = self._info.total_samples or 0
+		else:
+			nframes = npsecs * self._sample_rate // 75
+
+		return self.DummyReader(self, nframes)
 
-	def close(self):
-		self.orig.close(True)
+	def describe(self):
+		return self.command
+
+	def close(self, forced=False):
+		pass
 
 class DecoderHandler(Handler):
-	def open(self, filename, options=None):
+	def probe(self, filename):
+		params = probe(self.handler.name, filename)
+		if params is None:
+			return None
+
+		info = StreamInfo()
+		info.channels, info.bits_per_sample, info.sample_rate, info.total_samples = params
+		info.type = self.handler.name
+
+		return info
+
+	def open(self, filename, options=None, begin=None, end=None):
 		if self.handler.name == "wav":
 			cls = WavDecoder
 		else:
 			cls = AnyDecoder
 
-		stream = cls(self.handler, filename, options)
 		if options and options.dry_run:
-			stream = DummyDecoder(stream)
+			return self.open_dummy(cls, filename, options, begin, end)
+
+		return cls(self.handler, filename, options, begin, end)
+
+	def open_dummy(self, cls, filename, options, begin, end):
+		if cls is WavDecoder:
+			command = filename
+		elif begin is None and end is None:
+			command = " ".join(map(quote, self.handler.decode(filename)))
+		else:
+			command = " ".join(map(quote, self.handler.decode_range(filename, begin, end)))
+
+		# no process is started when the headers can be read here
+		info = self.probe(filename)
+		if info is None:
+			stream = cls(self.handler, filename, options, begin, end)
+			if not stream.ready():
+				return stream
+
+			info = stream.info()
+			info.total_samples = stream.reader.getnframes()
+			stream.close(True)
+
+		return DummyDecoder(self.handler, info, command)
 
-		return stream
+	def is_range_supported(self):
+		return self.handler.name == "wav" or hasattr(self.handler, "decode_range")
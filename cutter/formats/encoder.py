@@ -1,64 +1,83 @@
 from . command import *
 from . handler import *
+from . import wavfile
+from .. checksum import Checksum
 from .. tools import quote
 
 import subprocess
-import wave
+import os
 
 class EncoderError(Exception):
 	pass
 
-class Encoder:
-	FRAME_BUFFER_SIZE=0x4000
+def chunk_size(options, default):
+	size = getattr(options, "chunk_size", None)
+	return size << 10 if size else default
+
+def is_checksummed(handler, options, info):
+	# a checksum of converted audio would not match the output
+	return bool(options.checksum) and not handler.need_convert(options, info)
+
+def pump(reader, write, size, progress, checksum):
+	"""copy frames from reader to write()
+
+	Pipes are read through one preallocated buffer, mapped files and
+	readers fed by other threads hand over their own chunks.
+	"""
 
-	class SafeStream:
-		MIN_CHUNK_SIZE=64
+	readinto = getattr(reader, "readinto", None)
+	written = 0
 
-		def __init__(self, fileobj):
-			self.fileobj = fileobj
-			self.seek_called = False
-			self.written = 0
+	if readinto is None or reader.is_mapped():
+		# views of the mapped file go to write() without a copy
+		maxframes = size // getattr(reader, "bytes_per_frame", 4)
 
-			self.buffered = b""
+		data = reader.read(maxframes)
+		while len(data):
+			write(data)
+			written += len(data)
+			progress.update(len(data))
 
-		def seek(self, *args):
-			self.seek_called = True
+			if checksum is not None:
+				checksum.update(data)
 
-		def write(self, data):
-			if self.seek_called:
-				return
+			data = reader.read(maxframes)
 
-			nbytes = len(data)
-			if nbytes < self.MIN_CHUNK_SIZE:
-				self.buffered += data
-			else:
-				if len(self.buffered):
-					data = self.buffered + data
-					self.buffered = b""
+		return written
 
-				self.fileobj.write(data)
+	buf = bytearray(size)
+	view = memoryview(buf)
 
-			self.written += nbytes
+	nbytes = readinto(buf)
+	while nbytes:
+		data = view[:nbytes]
+		write(data)
+		written += nbytes
+		progress.update(nbytes)
 
-		def tell(self):
-			return self.written
+		if checksum is not None:
+			checksum.update(data)
 
-		def close(self):
-			if len(self.buffered):
-				self.fileobj.write(self.buffered)
+		nbytes = readinto(buf)
 
-			self.fileobj.close()
+	return written
 
-		def __getattr__(self, attr):
-			return getattr(self.fileobj, attr)
+class Encoder:
+	CHUNK_SIZE=0x40000
 
-	def __init__(self, handler, reader, filename, options):
+	def __init__(self, handler, reader, filename, options, tags=None):
 		self.proc = None
 		self.handler = handler
 
-		args = self.handler.encode(filename, options, reader.info())
+		info = reader.info()
+		args = self.handler.encode(filename, options, info, tags)
+		self.tagged = tags is not None and self.handler.embeds_tags(options, info)
 		self.command = " ".join(map(quote, args))
 
+		self.checksum = None
+		if is_checksummed(self.handler, options, info):
+			self.checksum = Checksum()
+
 		if options.dry_run:
 			return
 
@@ -67,9 +86,11 @@ class Encoder:
 			return
 
 		self.reader = reader
-		self.stream = self.SafeStream(self.proc.stdin)
-		self.writer = wave.open(self.stream, "w")
-		self.writer.setparams(reader.wave_params())
+		self.written = 0
+		self.chunk_size = chunk_size(options, self.CHUNK_SIZE)
+
+		channels, sample_width, rate, nframes = reader.wave_params()[:4]
+		self.proc.stdin.write(wavfile.header(channels, sample_width, rate, nframes))
 
 	def ready(self):
 		return self.proc.ready()
@@ -79,15 +100,8 @@ class Encoder:
 			return
 
 		progress.init(self.reader.size())
-
-		data = self.reader.read(self.FRAME_BUFFER_SIZE)
-
-		while len(data):
-			self.writer.writeframesraw(data)
-			progress.update(len(data))
-
-			data = self.reader.read(self.FRAME_BUFFER_SIZE)
-
+		self.written += pump(self.reader, self.proc.stdin.write,
+			self.chunk_size, progress, self.checksum)
 		progress.finish()
 
 	def describe(self):
@@ -98,16 +112,139 @@ class Encoder:
 
 	def close(self):
 		if self.proc is not None and self.proc.ready():
-			self.writer.close()
-			self.stream.close()
+			try:
+				if self.written & 1:
+					self.proc.stdin.write(b"\x00")
+				self.proc.stdin.close()
+			except (IOError, OSError):
+				# the encoder has exited, its status tells why
+				pass
+
 			self.proc.close()
 
 	def __del__(self):
 		self.close()
 
+class WavWriter:
+	"""writes pcm data to a wav file without an external encoder"""
+
+	COPY_BUFFER_SIZE=0x800000
+
+	def __init__(self, handler, reader, filename, options, tags=None):
+		self.fp = None
+		self.handler = handler
+		self.reader = reader
+		self.filename = filename
+		self.tagged = False
+		self.checksum = Checksum() if options.checksum else None
+
+		self.status = None
+		self.status_msg = ""
+
+		if options.dry_run:
+			return
+
+		try:
+			self.fp = open(filename, "wb")
+		except IOError as err:
+			self.status = "not started"
+			self.status_msg = err.strerror
+			return
+
+		self.params = reader.wave_params()
+		self.written = 0
+		self.chunk_size = chunk_size(options, Encoder.CHUNK_SIZE)
+
+	def ready(self):
+		return self.fp is not None
+
+	def header(self, nframes):
+		channels, sample_width, rate = self.params[:3]
+		return wavfile.header(channels, sample_width, rate, nframes)
+
+	def process(self, progress):
+		if not self.ready():
+			return
+
+		progress.init(self.reader.size())
+
+		self.fp.write(self.header(self.params[3]))
+		self.fp.flush()
+
+		bytes_per_frame = self.params[0] * self.params[1]
+		sendto = getattr(self.reader, "sendto", None)
+		if self.checksum is not None:
+			sendto = None
+
+		count = None
+		if sendto:
+			nframes = self.COPY_BUFFER_SIZE // bytes_per_frame
+			count = sendto(self.fp.fileno(), nframes)
+
+		if count is not None:
+			while count:
+				self.written += count * bytes_per_frame
+				progress.update(count * bytes_per_frame)
+				count = sendto(self.fp.fileno(), nframes)
+
+			self.fp.seek(0, os.SEEK_END)
+		else:
+			self.written += pump(self.reader, self.fp.write,
+				self.chunk_size, progress, self.checksum)
+
+		progress.finish()
+
+	def describe(self):
+		return self.filename
+
+	def get_status(self):
+		return self.status, self.status_msg
+
+	def close(self):
+		if self.fp is None:
+			return
+
+		if self.written & 1:
+			self.fp.write(b"\x00")
+
+		bytes_per_frame = self.params[0] * self.params[1]
+		if self.written != self.params[3] * bytes_per_frame:
+			self.fp.seek(0)
+			self.fp.write(self.header(self.written // bytes_per_frame))
+
+		self.fp.close()
+		self.fp = None
+
+	def __del__(self):
+		self.close()
+
 class EncoderHandler(Handler):
-	def open(self, reader, filename, options):
-		return Encoder(self.handler, reader, filename, options)
+	def is_writer(self, options, info):
+		return self.handler.name == "wav" and not self.handler.need_convert(options, info)
+
+	def is_checksummed(self, options, info):
+		"""whether an encode of info computes the checksum of its pcm data"""
+		return is_checksummed(self.handler, options, info)
+
+	def is_tagged(self, options, info, tags):
+		"""whether an encode of info embeds tags"""
+		if tags is None or self.is_writer(options, info):
+			return False
+
+		return self.handler.embeds_tags(options, info)
+
+	def open(self, reader, filename, options, tags=None):
+		if self.is_writer(options, reader.info()):
+			return WavWriter(self.handler, reader, filename, options, tags)
+
+		return Encoder(self.handler, reader, filename, options, tags)
+
+	def command(self, filename, options, info, tags=None):
+		if self.is_writer(options, info):
+			return filename
+
+		args = self.handler.encode(filename, options, info, tags)
+		return " ".join(map(quote, args))
 
 	def is_tag_supported(self):
 		return hasattr(self.handler, "tag")
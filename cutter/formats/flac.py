@@ -1,35 +1,152 @@
 from . sox import *
-from . command import *
-from .. coding import to_bytes
+from . handler import read_chunks, rewrite_file
+from . import vorbis
+from .. coding import to_unicode
+
+import struct
+import os
+
+class FlacTaggerError(Exception):
+	pass
+
+class FlacTagger:
+	STREAMINFO = 0
+	PADDING = 1
+	VORBIS_COMMENT = 4
+
+	# padding reserved when the metadata has to be rewritten
+	PADDING_SIZE = 8192
+
+	@staticmethod
+	def block(blocktype, data, last=False):
+		hdr = struct.pack(">I", len(data))
+		hdr = struct.pack("B", blocktype | (0x80 if last else 0)) + hdr[1:]
+		return hdr + data
+
+	def __init__(self, tags, padding=None):
+		self.tags = tags
+		self.padding = self.PADDING_SIZE if padding is None else padding
+
+	def read_blocks(self, fp):
+		if fp.read(4) != b"fLaC":
+			raise FlacTaggerError("not a flac file")
+
+		blocks = []
+		vendor = vorbis.VENDOR
+
+		last = False
+		while not last:
+			hdr = fp.read(4)
+			if len(hdr) != 4:
+				raise FlacTaggerError("unexpected end of metadata")
+
+			flags, = struct.unpack("B", hdr[:1])
+			size, = struct.unpack(">I", b"\x00" + hdr[1:])
+
+			last = flags & 0x80
+			blocktype = flags & 0x7f
+
+			if blocktype == self.PADDING:
+				fp.seek(size, os.SEEK_CUR)
+				continue
+
+			data = fp.read(size)
+			if len(data) != size:
+				raise FlacTaggerError("unexpected end of metadata")
+
+			if blocktype == self.VORBIS_COMMENT:
+				vendor = vorbis.unpack_vendor(data)
+			else:
+				blocks.append((blocktype, data))
+
+		if not blocks or blocks[0][0] != self.STREAMINFO:
+			raise FlacTaggerError("STREAMINFO block is missing")
+
+		return blocks, vendor
+
+	def pack(self, blocks, padding):
+		data = [self.block(t, d) for t, d in blocks]
+
+		if padding is not None:
+			data.append(self.block(self.PADDING, b"\x00" * padding, True))
+		else:
+			data[-1] = self.block(blocks[-1][0], blocks[-1][1], True)
+
+		return b"".join(data)
+
+	def write(self, path):
+		with open(path, "r+b") as fp:
+			blocks, vendor = self.read_blocks(fp)
+			offset = fp.tell()
+
+			comment = vorbis.pack_comment(vendor, self.tags)
+			blocks.insert(1, (self.VORBIS_COMMENT, comment))
+
+			size = sum([4 + len(data) for _, data in blocks])
+			space = offset - 4
+
+			if size == space:
+				padding = None
+			elif size + 4 <= space <= size + 4 + 0xffffff:
+				padding = space - size - 4
+			else:
+				metadata = self.pack(blocks, self.padding)
+				rewrite_file(path, b"fLaC" + metadata, read_chunks(fp, offset))
+				return
+
+			# the new metadata fits in place of the old one
+			fp.seek(4)
+			fp.write(self.pack(blocks, padding))
 
 class FlacHandler(SoxHandler):
 	name = "flac"
 	ext = "flac"
 	cmd = "flac"
+	sox_comments = True
 
-	def encode(self, path, opt, info):
+	def encode(self, path, opt, info, tags=None):
 		if opt.compression is not None:
 			self.set_compression(opt.compression)
 
-		return self.sox_args(path, opt, info)
+		return self.encode_args(path, opt, info, tags)
+
+	def native_args(self, path, opt, info, tags=None):
+		args = [self.cmd, "-s", "-f"]
+
+		if self.compression is not None:
+			args.append("-%d" % self.compression)
+
+		if tags:
+			args.extend(self.tag_args(tags))
+
+		args.extend(["-o", path, "-"])
+		return args
+
+	def tag_args(self, tags):
+		args = []
+		for entry in vorbis.comment_entries(tags):
+			args.extend(["-T", to_unicode(entry)])
+
+		return args
 
 	def decode(self, filename):
 		return [self.cmd, "-d", "-c", "-s", filename]
 
-	def tag(self, path, tags):
-		args = ["metaflac", "--remove-all-tags", "--import-tags-from=-", path]
-
-		proc = Command(args, stdin=PIPE)
-		if not proc.ready():
-			return False
+	def decode_range(self, filename, begin, end):
+		args = [self.cmd, "-d", "-c", "-s", "--skip=%d" % (begin or 0)]
+		if end is not None:
+			args.append("--until=%d" % end)
 
-		for k, v in tags.items():
-			proc.stdin.write(to_bytes("%s=%s\n" % (k.upper(), v)))
+		args.append(filename)
+		return args
 
-		proc.stdin.close()
-		proc.close()
+	def tag(self, path, tags):
+		try:
+			FlacTagger(tags, self.padding).write(path)
+		except (IOError, OSError, FlacTaggerError):
+			return False
 
-		return proc.status is 0
+		return True
 
 def init():
 	return FlacHandler
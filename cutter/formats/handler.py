@@ -1,6 +1,38 @@
+import tempfile
+import shutil
+import os
+
+COPY_BUFFER_SIZE = 0x100000
+
 def dev_null():
 	return open("/dev/null")
 
+def read_chunks(fp, offset, size=COPY_BUFFER_SIZE):
+	fp.seek(offset)
+
+	data = fp.read(size)
+	while len(data):
+		yield data
+		data = fp.read(size)
+
+def rewrite_file(path, head, chunks):
+	"""replace path with head followed by chunks"""
+
+	fd, tmpname = tempfile.mkstemp(prefix=".cutter-",
+		dir=os.path.dirname(path) or ".")
+
+	try:
+		with os.fdopen(fd, "wb") as out:
+			out.write(head)
+			for data in chunks:
+				out.write(data)
+
+		shutil.copymode(path, tmpname)
+		os.rename(tmpname, path)
+	except:
+		os.remove(tmpname)
+		raise
+
 class Handler:
 	def __init__(self, handler):
 		self.handler = handler
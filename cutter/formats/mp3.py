@@ -1,9 +1,11 @@
 from . sox import *
+from . handler import read_chunks, rewrite_file
 from .. coding import to_bytes
 
 import subprocess
 import struct
 import array
+import os
 
 def synchsafe(num):
 	if num <= 0x7f:
@@ -11,6 +13,13 @@ def synchsafe(num):
 
 	return synchsafe(num >> 7) << 8 | num & 0x7f
 
+def unsynchsafe(data):
+	num = 0
+	for byte in bytearray(data):
+		num = num << 7 | byte & 0x7f
+
+	return num
+
 class ID3Tagger:
 	# id3v2 frame mapping
 	__mapping = {
@@ -29,18 +38,35 @@ class ID3Tagger:
 		"album": 63,
 	}
 
+	# padding reserved when the file has to be rewritten
+	PADDING_SIZE = 1024
+
 	@staticmethod
 	def header(size):
 		return struct.pack(">3s3BI", b"ID3", 4, 0, 0, synchsafe(size))
 
+	@staticmethod
+	def tag_size(fp):
+		fp.seek(0)
+
+		hdr = fp.read(10)
+		if len(hdr) != 10 or hdr[:3] != b"ID3":
+			return 0
+
+		flags = bytearray(hdr)[5]
+		footer = 10 if flags & 0x10 else 0
+
+		return 10 + unsynchsafe(hdr[6:10]) + footer
+
 	@staticmethod
 	def frame(name, data):
 		size = len(data) + 1
 		hdr = struct.pack(">4sIHB", name, size, 0, 3)
 		return hdr + data
 
-	def __init__(self):
+	def __init__(self, padding=None):
 		self.frames = []
+		self.padding = self.PADDING_SIZE if padding is None else padding
 
 		self.v1 = array.array("B", b"\x00" * 128)
 		struct.pack_into("3s", self.v1, 0, b"TAG")
@@ -65,37 +91,88 @@ class ID3Tagger:
 			number = int(value.partition(b"/")[0])
 			struct.pack_into("B", self.v1, 126, number)
 
+	def write_v1(self, fp):
+		fp.seek(0, os.SEEK_END)
+		size = fp.tell()
+
+		if size >= 128:
+			fp.seek(size - 128)
+			if fp.read(3) == b"TAG":
+				size -= 128
+
+		fp.seek(size)
+		self.v1.tofile(fp)
+
 	def write(self, path):
-		fp = open(path, "r+b")
-		data = fp.read()
+		with open(path, "r+b") as fp:
+			size = self.tag_size(fp)
+			frames = b"".join(self.frames)
 
-		fp.seek(0)
-		fp.truncate(0)
+			if size and len(frames) + 10 <= size:
+				# old tag (id3v2.4 footer is not written) has enough room
+				fp.seek(0)
+				fp.write(self.header(size - 10))
+				fp.write(frames)
+				fp.write(b"\x00" * (size - 10 - len(frames)))
 
-		# save id3v2
-		fp.write(self.header(self.frame_size()))
-		for frame in self.frames:
-			fp.write(frame)
+				self.write_v1(fp)
+				return
 
-		fp.write(data)
+			header = self.header(len(frames) + self.padding)
+			head = header + frames + b"\x00" * self.padding
 
-		# save id3v1
-		self.v1.tofile(fp)
+			rewrite_file(path, head, read_chunks(fp, size))
 
-		fp.close()
+		with open(path, "r+b") as fp:
+			self.write_v1(fp)
 
 class Mp3Handler(SoxHandler):
 	name = "mp3"
 	ext = "mp3"
+	cmd = "lame"
+
+	# lame options for the id3 frames written by ID3Tagger
+	__lame_options = {
+		"album":	"--tl",
+		"artist":	"--ta",
+		"date":		"--ty",
+		"title":	"--tt",
+	}
 
-	def encode(self, path, opt, info):
+	def encode(self, path, opt, info, tags=None):
 		if opt.bitrate is not None:
 			self.set_compression(opt.bitrate)
 
-		return self.sox_args(path, opt, info)
+		return self.encode_args(path, opt, info, tags)
+
+	def native_args(self, path, opt, info, tags=None):
+		args = [self.cmd, "--quiet"]
+
+		if self.compression is not None:
+			args.extend(["--cbr", "-b", str(self.compression)])
+
+		if tags:
+			args.extend(self.tag_args(tags))
+
+		args.extend(["-", path])
+		return args
+
+	def tag_args(self, tags):
+		args = ["--add-id3v2"]
+
+		for k, v in sorted(tags.items()):
+			if v and k in self.__lame_options:
+				args.extend([self.__lame_options[k], "%s" % v])
+
+		if tags.get("composer"):
+			args.extend(["--tv", "TCOM=%s" % tags["composer"]])
+
+		args.extend(["--tn", "%d/%d" % (tags["tracknumber"], tags["tracktotal"])])
+
+		return args
 
 	def tag(self, path, tags):
-		tagger = ID3Tagger()
+		tagger = ID3Tagger(self.padding)
 
 		for k, v in tags.items():
 			if v and k not in ("tracknumber", "tracktotal"):
@@ -1,31 +1,235 @@
 from . sox import *
-from . command import *
-from .. coding import to_bytes
+from . handler import read_chunks, rewrite_file
+from . import vorbis
+from .. coding import to_unicode
+
+import struct
+import zlib
+
+__bitrev = bytes(bytearray([int("{:08b}".format(i)[::-1], 2) for i in range(256)]))
+
+def ogg_crc(data):
+	# ogg uses the non-reflected crc32, zlib computes the reflected one:
+	# they are equal up to the bit order of input bytes and of the result
+	crc = zlib.crc32(data.translate(__bitrev), 0xffffffff) ^ 0xffffffff
+	return int("{:032b}".format(crc & 0xffffffff)[::-1], 2)
+
+class OggTaggerError(Exception):
+	pass
+
+class OggPage:
+	HEADER = struct.Struct("<4sBBQIIIB")
+
+	CONTINUED = 0x01
+	NO_GRANULE = 0xffffffffffffffff
+
+	def __init__(self, flags, granule, serial, seqno, lacing, body):
+		self.flags = flags
+		self.granule = granule
+		self.serial = serial
+		self.seqno = seqno
+		self.lacing = bytearray(lacing)
+		self.body = body
+
+	@classmethod
+	def read(cls, fp):
+		hdr = fp.read(cls.HEADER.size)
+		if not len(hdr):
+			return None
+
+		if len(hdr) != cls.HEADER.size:
+			raise OggTaggerError("truncated page")
+
+		magic, version, flags, granule, serial, seqno, _, nsegs = \
+			cls.HEADER.unpack(hdr)
+
+		if magic != b"OggS" or version != 0:
+			raise OggTaggerError("invalid page")
+
+		lacing = bytearray(fp.read(nsegs))
+		body = fp.read(sum(lacing))
+
+		if len(lacing) != nsegs or len(body) != sum(lacing):
+			raise OggTaggerError("truncated page")
+
+		return cls(flags, granule, serial, seqno, lacing, body)
+
+	def packets(self):
+		pos = 0
+		for lace in self.lacing:
+			yield self.body[pos:pos + lace], lace < 255
+			pos += lace
+
+	def pack(self):
+		data = self.HEADER.pack(b"OggS", 0, self.flags, self.granule,
+			self.serial, self.seqno, 0, len(self.lacing))
+		data += bytes(self.lacing) + self.body
+
+		return data[:22] + struct.pack("<I", ogg_crc(data)) + data[26:]
+
+class OggTagger:
+	# padding added to the comment header when the file is rewritten
+	PADDING_SIZE = 1024
+
+	@staticmethod
+	def lacing(size):
+		return [255] * (size // 255) + [size % 255]
+
+	@staticmethod
+	def page_counts(nsegs, npages):
+		counts = []
+		for n in range(npages, 0, -1):
+			count = min(255, nsegs - n + 1)
+			counts.append(count)
+			nsegs -= count
+
+		return counts
+
+	def __init__(self, tags, padding=None):
+		self.tags = tags
+		self.padding = self.PADDING_SIZE if padding is None else padding
+
+	def read_headers(self, fp):
+		first = OggPage.read(fp)
+		if first is None or not first.body.startswith(b"\x01vorbis"):
+			raise OggTaggerError("not an ogg vorbis file")
+
+		pages = []
+		packets = []
+		data = []
+
+		while len(packets) < 2:
+			page = OggPage.read(fp)
+			if page is None or page.serial != first.serial:
+				raise OggTaggerError("vorbis headers are missing")
+
+			pages.append(page)
+
+			for segment, complete in page.packets():
+				if len(packets) == 2:
+					raise OggTaggerError("setup header does not end a page")
+
+				data.append(segment)
+				if complete:
+					packets.append(b"".join(data))
+					data = []
+
+		comment, setup = packets
+		if not comment.startswith(b"\x03vorbis") or not setup.startswith(b"\x05vorbis"):
+			raise OggTaggerError("invalid vorbis headers")
+
+		return first, pages, comment, setup, fp.tell()
+
+	def paginate(self, first, packets, counts):
+		segments = []
+		for packet in packets:
+			pos = 0
+			for lace in self.lacing(len(packet)):
+				segments.append((lace, packet[pos:pos + lace]))
+				pos += lace
+
+		pages = []
+		flags = 0
+
+		for seqno, count in enumerate(counts, first.seqno + 1):
+			chunk, segments = segments[:count], segments[count:]
+
+			lacing = [lace for lace, _ in chunk]
+			body = b"".join([data for _, data in chunk])
+			granule = 0 if min(lacing) < 255 else OggPage.NO_GRANULE
+
+			pages.append(OggPage(flags, granule, first.serial, seqno, lacing, body))
+			flags = OggPage.CONTINUED if lacing[-1] == 255 else 0
+
+		return pages
+
+	def renumber(self, fp, offset, serial, delta):
+		fp.seek(offset)
+
+		page = OggPage.read(fp)
+		while page is not None:
+			if page.serial == serial:
+				page.seqno += delta
+
+			yield page.pack()
+			page = OggPage.read(fp)
+
+	def write(self, path):
+		with open(path, "r+b") as fp:
+			first, pages, comment, setup, offset = self.read_headers(fp)
+
+			vendor = vorbis.unpack_vendor(comment[7:])
+			packet = b"\x03vorbis" + vorbis.pack_comment(vendor, self.tags) + b"\x01"
+
+			if len(packet) <= len(comment):
+				# vorbis decoders ignore data after the framing bit,
+				# so the old page layout can be kept and rewritten in place
+				packet += b"\x00" * (len(comment) - len(packet))
+				counts = [len(page.lacing) for page in pages]
+
+				fp.seek(first.HEADER.size + len(first.lacing) + len(first.body))
+				for page in self.paginate(first, [packet, setup], counts):
+					fp.write(page.pack())
+
+				return
+
+			packet += b"\x00" * self.padding
+
+			nsegs = len(self.lacing(len(packet))) + len(self.lacing(len(setup)))
+			npages = max(len(pages), (nsegs + 254) // 255)
+			npages = min(npages, nsegs)
+
+			counts = self.page_counts(nsegs, npages)
+			new_pages = self.paginate(first, [packet, setup], counts)
+
+			head = first.pack() + b"".join([page.pack() for page in new_pages])
+			delta = len(new_pages) - len(pages)
+
+			if delta:
+				chunks = self.renumber(fp, offset, first.serial, delta)
+			else:
+				chunks = read_chunks(fp, offset)
+
+			rewrite_file(path, head, chunks)
 
 class OggHandler(SoxHandler):
 	name = "ogg"
 	ext = "ogg"
+	cmd = "oggenc"
+	sox_comments = True
 
-	def encode(self, path, opt, info):
+	def encode(self, path, opt, info, tags=None):
 		if opt.compression is not None:
 			self.set_compression(opt.compression)
 
-		return self.sox_args(path, opt, info)
+		return self.encode_args(path, opt, info, tags)
 
-	def tag(self, path, tags):
-		args = ["vorbiscomment", "--raw", "--write", path]
+	def native_args(self, path, opt, info, tags=None):
+		args = [self.cmd, "-Q"]
 
-		proc = Command(args, stdin=PIPE)
-		if not proc.ready():
-			return False
+		if self.compression is not None:
+			args.extend(["-q", str(self.compression)])
+
+		if tags:
+			args.extend(self.tag_args(tags))
+
+		args.extend(["-o", path, "-"])
+		return args
 
-		for k, v in tags.items():
-			proc.stdin.write(to_bytes("%s=%s\n" % (k.upper(), v)))
+	def tag_args(self, tags):
+		args = []
+		for entry in vorbis.comment_entries(tags):
+			args.extend(["-c", to_unicode(entry)])
 
-		proc.stdin.close()
-		proc.close()
+		return args
+
+	def tag(self, path, tags):
+		try:
+			OggTagger(tags, self.padding).write(path)
+		except (IOError, OSError, OggTaggerError):
+			return False
 
-		return proc.status is 0
+		return True
 
 def init():
 	return OggHandler
@@ -0,0 +1,221 @@
+"""stream parameters read from the headers of audio files
+
+Every probe returns (channels, bits per sample, sample rate, total
+samples), the total is None when the header does not know it.
+"""
+
+from . wavfile import parse_fmt, WavFileError
+
+import struct
+import os
+
+class ProbeError(Exception):
+	pass
+
+def read_exactly(fp, size):
+	data = fp.read(size)
+	if len(data) != size:
+		raise ProbeError("unexpected end of file")
+
+	return data
+
+def skip_id3v2(fp):
+	"""skip an id3v2 tag some encoders put before the stream"""
+
+	hdr = fp.read(10)
+	if len(hdr) != 10 or hdr[:3] != b"ID3":
+		fp.seek(0)
+		return
+
+	flags = struct.unpack("B", hdr[5:6])[0]
+	b = struct.unpack("4B", hdr[6:10])
+	size = (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+	# a footer repeats the header
+	fp.seek(10 + size + (10 if flags & 0x10 else 0))
+
+def probe_flac(fp):
+	skip_id3v2(fp)
+	if fp.read(4) != b"fLaC":
+		raise ProbeError("not a flac file")
+
+	flags = struct.unpack("B", read_exactly(fp, 4)[:1])[0]
+	if flags & 0x7f != 0:
+		raise ProbeError("STREAMINFO block is missing")
+
+	data = read_exactly(fp, 34)
+	value, = struct.unpack(">Q", data[10:18])
+
+	rate = value >> 44
+	channels = ((value >> 41) & 0x7) + 1
+	bits = ((value >> 36) & 0x1f) + 1
+	nsamples = value & 0xfffffffff
+
+	return channels, bits, rate, nsamples or None
+
+WAVPACK_RATES = [
+	6000, 8000, 9600, 11025, 12000, 16000, 22050, 24000,
+	32000, 44100, 48000, 64000, 88200, 96000, 192000,
+]
+
+WAVPACK_MONO = 0x4
+WAVPACK_FLOAT = 0x80
+WAVPACK_DSD = 0x80000000
+WAVPACK_ID_CHANNEL_INFO = 0xd
+WAVPACK_ID_SAMPLE_RATE = 0x27
+WAVPACK_SEARCH_SIZE = 0x100000
+
+def wavpack_metadata(data):
+	"""(id, data) of the metadata sub-blocks of a wavpack block"""
+
+	offset = 0
+	while offset + 2 <= len(data):
+		id, size = struct.unpack_from("BB", data, offset)
+		offset += 2
+
+		if id & 0x80:
+			if offset + 2 > len(data):
+				break
+
+			size += struct.unpack_from("<H", data, offset)[0] << 8
+			offset += 2
+
+		size *= 2
+		length = size - 1 if id & 0x40 else size
+
+		yield id & 0x3f, data[offset:offset + length]
+		offset += size
+
+def probe_wavpack(fp):
+	data = fp.read(WAVPACK_SEARCH_SIZE)
+	start = data.find(b"wvpk")
+	if start < 0:
+		raise ProbeError("not a wavpack file")
+
+	fp.seek(start)
+	hdr = read_exactly(fp, 32)
+
+	size, _, _, total_u8, total, _, _, flags = \
+		struct.unpack_from("<IHBBIIII", hdr, 4)
+
+	if flags & (WAVPACK_FLOAT | WAVPACK_DSD):
+		raise ProbeError("not an integer pcm stream")
+
+	bits = ((flags & 0x3) + 1) * 8
+	channels = 1 if flags & WAVPACK_MONO else 2
+
+	srate = (flags >> 23) & 0xf
+	rate = WAVPACK_RATES[srate] if srate < len(WAVPACK_RATES) else None
+
+	for id, value in wavpack_metadata(read_exactly(fp, size - 24)):
+		if id == WAVPACK_ID_CHANNEL_INFO and len(value):
+			channels = struct.unpack("B", value[:1])[0]
+		elif id == WAVPACK_ID_SAMPLE_RATE and len(value) >= 3:
+			rate = struct.unpack("<I", value[:3] + b"\x00")[0]
+
+	if rate is None:
+		raise ProbeError("unknown sample rate")
+
+	nsamples = (total_u8 << 32) | total
+	if total == 0xffffffff:
+		nsamples = None
+
+	return channels, bits, rate, nsamples
+
+APE_FLAG_8BIT = 0x1
+APE_FLAG_24BIT = 0x8
+APE_COMPRESSION_EXTRA_HIGH = 4000
+
+def ape_blocks_per_frame(version, compression):
+	if version >= 3950:
+		return 73728 * 4
+	if version >= 3900 or (version >= 3800 and compression >= APE_COMPRESSION_EXTRA_HIGH):
+		return 73728
+
+	return 9216
+
+def probe_ape(fp):
+	skip_id3v2(fp)
+	hdr = read_exactly(fp, 6)
+	if hdr[:4] != b"MAC ":
+		raise ProbeError("not an ape file")
+
+	version, = struct.unpack("<H", hdr[4:])
+
+	if version >= 3980:
+		# APE_DESCRIPTOR, then APE_HEADER
+		_, descriptor = struct.unpack("<HI", read_exactly(fp, 6))
+		fp.seek(descriptor - 12, os.SEEK_CUR)
+
+		_, _, per_frame, final, nframes, bits, channels, rate = \
+			struct.unpack("<HHIIIHHI", read_exactly(fp, 24))
+	else:
+		compression, flags, channels, rate, _, _, nframes, final = \
+			struct.unpack("<HHHIIIII", read_exactly(fp, 26))
+
+		per_frame = ape_blocks_per_frame(version, compression)
+
+		if flags & APE_FLAG_8BIT:
+			bits = 8
+		elif flags & APE_FLAG_24BIT:
+			bits = 24
+		else:
+			bits = 16
+
+	nsamples = (nframes - 1) * per_frame + final if nframes else 0
+
+	return channels, bits, rate, nsamples
+
+def probe_wav(fp):
+	hdr = read_exactly(fp, 12)
+	if hdr[:4] != b"RIFF" or hdr[8:12] != b"WAVE":
+		raise ProbeError("file does not start with RIFF/WAVE id")
+
+	params = None
+	while True:
+		name, length = struct.unpack("<4sI", read_exactly(fp, 8))
+
+		if name == b"data":
+			if params is None:
+				raise ProbeError("data chunk before fmt chunk")
+
+			channels, width, rate, bits = params
+			length = min(length, os.fstat(fp.fileno()).st_size - fp.tell())
+
+			return channels, bits, rate, length // (channels * width)
+
+		if name == b"fmt ":
+			data = read_exactly(fp, length)
+			channels, width, rate = parse_fmt(data)
+			params = channels, width, rate, width * 8
+
+			if length & 1:
+				fp.seek(1, os.SEEK_CUR)
+		else:
+			fp.seek(length + (length & 1), os.SEEK_CUR)
+
+PROBES = {
+	"flac": probe_flac,
+	"wavpack": probe_wavpack,
+	"ape": probe_ape,
+	"wav": probe_wav,
+}
+
+def probe(name, filename):
+	"""stream parameters of filename decoded by handler name, None if unknown"""
+
+	func = PROBES.get(name)
+	if func is None:
+		return None
+
+	try:
+		with open(filename, "rb") as fp:
+			channels, bits, rate, nsamples = func(fp)
+	except (IOError, OSError, struct.error, ProbeError, WavFileError):
+		return None
+
+	if not channels or not bits or not rate:
+		return None
+
+	# decoders write whole bytes, 20 bits come out as 24
+	return channels, (bits + 7) // 8 * 8, rate, nsamples
@@ -1,11 +1,47 @@
 class SoxHandler:
+	# sox stores "KEY=VALUE" comments as tags of the output file
+	sox_comments = False
+
 	def __init__(self):
 		self.compression = None
+		self.padding = None
 
 	def set_compression(self, value):
 		self.compression = value
 
-	def sox_args(self, path, opt, info):
+	def set_padding(self, value):
+		self.padding = value
+
+	@staticmethod
+	def need_convert(opt, info):
+		if opt.sample_rate and opt.sample_rate != info.sample_rate:
+			return True
+		if opt.bits_per_sample and opt.bits_per_sample != info.bits_per_sample:
+			return True
+		if opt.channels and opt.channels != info.channels:
+			return True
+
+		return False
+
+	def is_native(self, opt, info):
+		if opt.backend != "native" or not hasattr(self, "native_args"):
+			return False
+
+		return not self.need_convert(opt, info)
+
+	def embeds_tags(self, opt, info):
+		if self.is_native(opt, info):
+			return hasattr(self, "tag_args")
+
+		return self.sox_comments
+
+	def encode_args(self, path, opt, info, tags=None):
+		if self.is_native(opt, info):
+			return self.native_args(path, opt, info, tags)
+
+		return self.sox_args(path, opt, info, tags)
+
+	def sox_args(self, path, opt, info, tags=None):
 		args = ["sox", "-V1", "-"]
 
 		if self.compression is not None:
@@ -18,6 +54,10 @@ class SoxHandler:
 		if opt.channels and opt.channels != info.channels:
 			args.extend(["-c", str(opt.channels)])
 
+		if tags and self.sox_comments:
+			for k, v in sorted(tags.items()):
+				args.extend(["--add-comment", "%s=%s" % (k.upper(), v)])
+
 		args.append(path)
 
 		return args
@@ -0,0 +1,27 @@
+from .. coding import to_bytes
+
+import struct
+
+VENDOR = b"cutter"
+
+def comment_entries(tags):
+	return [to_bytes("%s=%s" % (k.upper(), v)) for k, v in sorted(tags.items())]
+
+def pack_comment(vendor, tags):
+	"""vorbis comment structure, without the framing bit used in ogg"""
+
+	entries = comment_entries(tags)
+
+	data = [struct.pack("<I", len(vendor)), vendor, struct.pack("<I", len(entries))]
+	for entry in entries:
+		data.append(struct.pack("<I", len(entry)))
+		data.append(entry)
+
+	return b"".join(data)
+
+def unpack_vendor(data):
+	if len(data) < 4:
+		return VENDOR
+
+	length, = struct.unpack_from("<I", data, 0)
+	return data[4:4 + length] or VENDOR
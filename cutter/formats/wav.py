@@ -7,7 +7,7 @@ class WavHandler(SoxHandler):
 	def decode(self, filename):
 		return ["cat", filename]
 
-	def encode(self, path, opt, info):
+	def encode(self, path, opt, info, tags=None):
 		return self.sox_args(path, opt, info)
 
 def init():
@@ -0,0 +1,238 @@
+import struct
+import mmap
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xfffe
+
+class WavFileError(Exception):
+	pass
+
+def header(channels, sample_width, rate, nframes):
+	size = nframes * channels * sample_width
+	align = channels * sample_width
+
+	return struct.pack("<4sI4s4sIHHIIHH4sI",
+		b"RIFF", 36 + size + (size & 1), b"WAVE",
+		b"fmt ", 16, WAVE_FORMAT_PCM, channels, rate, rate * align,
+		align, sample_width * 8, b"data", size)
+
+def parse_fmt(data):
+	if len(data) < 16:
+		raise WavFileError("fmt chunk is too short")
+
+	tag, channels, rate, _, align, bits = struct.unpack_from("<HHIIHH", data, 0)
+
+	if tag == WAVE_FORMAT_EXTENSIBLE and len(data) >= 40:
+		tag, = struct.unpack_from("<H", data, 24)
+
+	if tag != WAVE_FORMAT_PCM:
+		raise WavFileError("unsupported format: %#x" % tag)
+
+	if not channels or not bits:
+		raise WavFileError("bad # of channels or sample width")
+
+	return channels, (bits + 7) // 8, rate
+
+class WavFile:
+	"""memory-mapped wav file reader with the interface of wave.Wave_read
+
+	readframes() returns views of the mapped data, no copies are made.
+	"""
+
+	def __init__(self, filename):
+		self.fp = open(filename, "rb")
+		self.map = None
+		self.view = None
+
+		try:
+			self.map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+			self._parse()
+		except:
+			self.close()
+			raise
+
+		try:
+			self.view = memoryview(self.map)
+		except TypeError:
+			# python 2 mmap does not support the buffer interface
+			self.view = self.map
+
+		self.pos = 0
+
+	def _parse(self):
+		size = len(self.map)
+		if size < 12 or self.map[0:4] != b"RIFF" or self.map[8:12] != b"WAVE":
+			raise WavFileError("file does not start with RIFF/WAVE id")
+
+		self.frame_size = None
+
+		offset = 12
+		while offset + 8 <= size:
+			name, length = struct.unpack_from("<4sI", self.map, offset)
+			offset += 8
+
+			if name == b"fmt ":
+				fmt = self.map[offset:offset + length]
+				self.channels, self.sample_width, self.sample_rate = parse_fmt(fmt)
+				self.frame_size = self.channels * self.sample_width
+			elif name == b"data":
+				if self.frame_size is None:
+					raise WavFileError("data chunk before fmt chunk")
+
+				self.data_offset = offset
+				self.data_size = min(length, size - offset)
+				self.nframes = self.data_size // self.frame_size
+				return
+
+			offset += length + (length & 1)
+
+		raise WavFileError("data chunk is missing")
+
+	def fileno(self):
+		return self.fp.fileno()
+
+	def getnchannels(self):
+		return self.channels
+
+	def getsampwidth(self):
+		return self.sample_width
+
+	def getframerate(self):
+		return self.sample_rate
+
+	def getnframes(self):
+		return self.nframes
+
+	def getparams(self):
+		return (self.channels, self.sample_width, self.sample_rate,
+			self.nframes, "NONE", "not compressed")
+
+	def tell(self):
+		return self.pos
+
+	def setpos(self, pos):
+		if pos < 0 or pos > self.nframes:
+			raise WavFileError("position not in range")
+
+		self.pos = pos
+
+	def offset(self, pos=None):
+		if pos is None:
+			pos = self.pos
+
+		return self.data_offset + pos * self.frame_size
+
+	def readframes(self, nframes):
+		nframes = max(min(nframes, self.nframes - self.pos), 0)
+
+		start = self.offset()
+		self.pos += nframes
+
+		return self.view[start:start + nframes * self.frame_size]
+
+	def readinto(self, buf):
+		nframes = max(min(len(buf) // self.frame_size, self.nframes - self.pos), 0)
+		nbytes = nframes * self.frame_size
+
+		start = self.offset()
+		self.pos += nframes
+
+		buf[:nbytes] = self.view[start:start + nbytes]
+		return nbytes
+
+	def close(self):
+		if self.map is not None:
+			if self.view is not None and self.view is not self.map:
+				self.view.release()
+
+			try:
+				self.map.close()
+			except BufferError:
+				# frames are still referenced, unmapped when released
+				pass
+
+			self.map = None
+
+		if self.fp is not None:
+			self.fp.close()
+			self.fp = None
+
+class WavStream:
+	"""wav reader for pipes with the interface of wave.Wave_read
+
+	Frames are read straight from the pipe, readinto() fills a buffer
+	without allocating.
+	"""
+
+	def __init__(self, fp):
+		self.fp = fp
+		self.pos = 0
+
+		hdr = self._read(12)
+		if hdr[0:4] != b"RIFF" or hdr[8:12] != b"WAVE":
+			raise WavFileError("file does not start with RIFF/WAVE id")
+
+		fmt = None
+		while True:
+			name, length = struct.unpack("<4sI", self._read(8))
+
+			if name == b"data":
+				break
+
+			data = self._read(length + (length & 1))
+			if name == b"fmt ":
+				fmt = parse_fmt(data[:length])
+
+		if fmt is None:
+			raise WavFileError("data chunk before fmt chunk")
+
+		self.channels, self.sample_width, self.sample_rate = fmt
+		self.frame_size = self.channels * self.sample_width
+		self.nframes = length // self.frame_size
+
+	def _read(self, size):
+		data = self.fp.read(size)
+		if len(data) != size:
+			raise WavFileError("unexpected end of file")
+
+		return data
+
+	def getnchannels(self):
+		return self.channels
+
+	def getsampwidth(self):
+		return self.sample_width
+
+	def getframerate(self):
+		return self.sample_rate
+
+	def getnframes(self):
+		return self.nframes
+
+	def getparams(self):
+		return (self.channels, self.sample_width, self.sample_rate,
+			self.nframes, "NONE", "not compressed")
+
+	def tell(self):
+		return self.pos
+
+	def readframes(self, nframes):
+		nframes = max(min(nframes, self.nframes - self.pos), 0)
+
+		data = self.fp.read(nframes * self.frame_size)
+		self.pos += len(data) // self.frame_size
+
+		return data
+
+	def readinto(self, buf):
+		nframes = max(min(len(buf) // self.frame_size, self.nframes - self.pos), 0)
+		if not nframes:
+			return 0
+
+		nbytes = self.fp.readinto(memoryview(buf)[:nframes * self.frame_size])
+		self.pos += nbytes // self.frame_size
+
+		return nbytes
+
+	def close(self):
+		pass
@@ -6,5 +6,13 @@ class WavpackHandler:
 	def decode(self, filename):
 		return [self.cmd, "-q", filename, "-o", "-"]
 
+	def decode_range(self, filename, begin, end):
+		args = [self.cmd, "-q", "--skip=%d" % (begin or 0)]
+		if end is not None:
+			args.append("--until=%d" % end)
+
+		args.extend([filename, "-o", "-"])
+		return args
+
 def init():
 	return WavpackHandler
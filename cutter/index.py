@@ -0,0 +1,134 @@
+from . formats.decoder import StreamInfo
+from . coding import to_unicode
+from . tools import printerr, quote
+from . import cue
+
+import threading
+import sqlite3
+import json
+import os
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cues (
+	path TEXT,
+	coding TEXT,
+	mtime REAL,
+	size INTEGER,
+	data TEXT,
+	PRIMARY KEY (path, coding)
+);
+
+CREATE TABLE IF NOT EXISTS streams (
+	path TEXT PRIMARY KEY,
+	mtime REAL,
+	size INTEGER,
+	type TEXT,
+	channels INTEGER,
+	bits_per_sample INTEGER,
+	sample_rate INTEGER
+);
+"""
+
+def file_key(path):
+	st = os.stat(path)
+	return to_unicode(os.path.abspath(path)), st.st_mtime, st.st_size
+
+class DummyIndex:
+	def get_cue(self, path, coding=None):
+		return None
+
+	def put_cue(self, path, coding, cuesheet):
+		pass
+
+	def get_info(self, path):
+		return None
+
+	def put_info(self, path, info):
+		pass
+
+class Index(DummyIndex):
+	"""parsed cue sheets and stream parameters of audio files
+
+	Entries are stored by absolute path and are valid while the mtime
+	and size of the file are unchanged.
+	"""
+
+	def __init__(self, path):
+		path = os.path.expanduser(path)
+
+		dir = os.path.dirname(path)
+		if dir and not os.path.exists(dir):
+			os.makedirs(dir)
+
+		# batch workers share the database, a locked one is waited for
+		# and the files of a cue sheet are split in several threads
+		self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.lock = threading.Lock()
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.executescript(SCHEMA)
+
+	def lookup(self, query, path, *args):
+		try:
+			name, mtime, size = file_key(path)
+			with self.lock:
+				row = self.db.execute(query, (name,) + args).fetchone()
+		except (OSError, sqlite3.Error):
+			return None
+
+		if row is None or row[0] != mtime or row[1] != size:
+			return None
+
+		return row[2:]
+
+	def store(self, query, path, *args):
+		try:
+			key = file_key(path)
+			with self.lock, self.db:
+				self.db.execute(query, key + args)
+		except (OSError, sqlite3.Error):
+			pass
+
+	def get_cue(self, path, coding=None):
+		row = self.lookup("SELECT mtime, size, data FROM cues "
+			"WHERE path = ? AND coding = ?", path, coding or u"")
+
+		if row is None:
+			return None
+
+		try:
+			return cue.deserialize(json.loads(row[0]))
+		except (ValueError, KeyError, TypeError, cue.CueParserError):
+			return None
+
+	def put_cue(self, path, coding, cuesheet):
+		self.store("INSERT OR REPLACE INTO cues "
+			"(path, mtime, size, coding, data) VALUES (?, ?, ?, ?, ?)",
+			path, coding or u"", json.dumps(cue.serialize(cuesheet)))
+
+	def get_info(self, path):
+		row = self.lookup("SELECT mtime, size, type, channels, bits_per_sample, "
+			"sample_rate FROM streams WHERE path = ?", path)
+
+		if row is None:
+			return None
+
+		info = StreamInfo()
+		info.type, info.channels, info.bits_per_sample, info.sample_rate = row
+
+		return info
+
+	def put_info(self, path, info):
+		self.store("INSERT OR REPLACE INTO streams "
+			"(path, mtime, size, type, channels, bits_per_sample, sample_rate) "
+			"VALUES (?, ?, ?, ?, ?, ?, ?)",
+			path, info.type, info.channels, info.bits_per_sample, info.sample_rate)
+
+def open_index(path):
+	if not path:
+		return DummyIndex()
+
+	try:
+		return Index(path)
+	except (OSError, sqlite3.Error) as err:
+		printerr("open index %s failed: %s", quote(path), err)
+		return DummyIndex()
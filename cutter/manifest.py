@@ -0,0 +1,121 @@
+from . coding import to_unicode
+
+import threading
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".cutter-manifest.json"
+JOURNAL_SUFFIX = ".journal"
+HASH_BUFFER_SIZE = 0x100000
+
+def file_md5(path):
+	md5 = hashlib.md5()
+
+	with open(path, "rb") as fp:
+		data = fp.read(HASH_BUFFER_SIZE)
+		while len(data):
+			md5.update(data)
+			data = fp.read(HASH_BUFFER_SIZE)
+
+	return md5.hexdigest()
+
+def source_id(path):
+	st = os.stat(path)
+
+	return {
+		"path": to_unicode(os.path.abspath(path)),
+		"size": st.st_size,
+		"mtime": int(st.st_mtime),
+	}
+
+class Manifest:
+	"""finished tracks of an output directory, used to resume split runs
+
+	Tracks are appended to a journal as they finish, close() merges it
+	into the manifest. The journal of an interrupted run is read back.
+	"""
+
+	def __init__(self, dir):
+		self.dir = dir
+		self.path = os.path.join(dir, MANIFEST_NAME)
+		self.journal = self.path + JOURNAL_SUFFIX
+		self.lock = threading.Lock()
+		self.tracks = {}
+		self.fp = None
+
+		try:
+			with open(self.path) as fp:
+				self.tracks = json.load(fp).get("tracks", {})
+		except (IOError, OSError, ValueError, AttributeError):
+			pass
+
+		self.load_journal()
+
+	def load_journal(self):
+		try:
+			with open(self.journal) as fp:
+				for line in fp:
+					try:
+						name, entry = json.loads(line)
+					except ValueError:
+						# the line of a track cut short by the interruption
+						continue
+
+					self.tracks[name] = entry
+		except (IOError, OSError):
+			pass
+
+	def is_done(self, name, entry):
+		with self.lock:
+			done = self.tracks.get(name)
+
+		if not done:
+			return False
+
+		for k, v in entry.items():
+			if done.get(k) != v:
+				return False
+
+		path = os.path.join(self.dir, name)
+		try:
+			if os.path.getsize(path) != done.get("size"):
+				return False
+
+			return file_md5(path) == done.get("hash")
+		except (IOError, OSError):
+			return False
+
+	def add(self, name, entry, path):
+		entry = dict(entry)
+		entry["size"] = os.path.getsize(path)
+		entry["hash"] = file_md5(path)
+
+		with self.lock:
+			self.tracks[name] = entry
+
+			if self.fp is None:
+				self.fp = open(self.journal, "a")
+
+			self.fp.write(json.dumps([name, entry], sort_keys=True) + "\n")
+			self.fp.flush()
+
+	def save(self):
+		tmpname = self.path + ".tmp"
+
+		with open(tmpname, "w") as fp:
+			json.dump({"tracks": self.tracks}, fp, indent=1, sort_keys=True)
+
+		os.rename(tmpname, self.path)
+
+	def close(self):
+		with self.lock:
+			if self.fp is None and not os.path.exists(self.journal):
+				return
+
+			if self.fp is not None:
+				self.fp.close()
+				self.fp = None
+
+			self.save()
+			os.remove(self.journal)
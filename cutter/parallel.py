@@ -0,0 +1,144 @@
+from . tools import printerr
+
+import collections
+import threading
+
+class Buffer:
+	"""memory budget shared by several channels"""
+
+	def __init__(self, size):
+		self.size = size
+		self.used = 0
+		self.cond = threading.Condition()
+
+class Channel:
+	def __init__(self, buffer):
+		self.buffer = buffer
+		self.chunks = collections.deque()
+		self.closed = False
+		self.aborted = False
+
+	def put(self, data):
+		buf = self.buffer
+		nbytes = len(data)
+
+		with buf.cond:
+			while buf.used and buf.used + nbytes > buf.size:
+				if self.aborted:
+					break
+				buf.cond.wait()
+
+			if self.aborted:
+				return False
+
+			self.chunks.append(data)
+			buf.used += nbytes
+			buf.cond.notify_all()
+
+		return True
+
+	def get(self):
+		buf = self.buffer
+
+		with buf.cond:
+			while not self.chunks and not self.closed and not self.aborted:
+				buf.cond.wait()
+
+			if not self.chunks:
+				return b""
+
+			data = self.chunks.popleft()
+			buf.used -= len(data)
+			buf.cond.notify_all()
+
+		return data
+
+	def close(self):
+		with self.buffer.cond:
+			self.closed = True
+			self.buffer.cond.notify_all()
+
+	def abort(self):
+		buf = self.buffer
+
+		with buf.cond:
+			self.aborted = True
+			buf.used -= sum(map(len, self.chunks))
+			self.chunks.clear()
+			buf.cond.notify_all()
+
+class ChannelReader:
+	"""decoder reader whose data is fed by another thread"""
+
+	FRAME_BUFFER_SIZE=0x4000
+
+	def __init__(self, reader, buffer, maxframes=None):
+		self.reader = reader
+		self.channel = Channel(buffer)
+		self.maxframes = maxframes or self.FRAME_BUFFER_SIZE
+
+	def info(self):
+		return self.reader.info()
+
+	def wave_params(self):
+		return self.reader.wave_params()
+
+	def size(self):
+		return self.reader.size()
+
+	def read(self, maxframes=None):
+		return self.channel.get()
+
+	def feed(self):
+		data = self.reader.read(self.maxframes)
+
+		while len(data):
+			if not self.channel.put(data):
+				return False
+
+			data = self.reader.read(self.maxframes)
+
+		self.channel.close()
+		return True
+
+	def abort(self):
+		self.channel.abort()
+
+class Pool:
+	"""run jobs in at most `size` threads at once
+
+	Pools given the same `slots` semaphore share its limit.
+	"""
+
+	def __init__(self, size, slots=None):
+		self.slots = slots if slots is not None else threading.Semaphore(size)
+		self.threads = []
+		self.failed = False
+
+	def __run(self, func, args):
+		try:
+			func(*args)
+		except SystemExit as exc:
+			if exc.code:
+				self.failed = True
+		except Exception as exc:
+			printerr("%s (%s)", exc, exc.__class__.__name__)
+			self.failed = True
+		finally:
+			self.slots.release()
+
+	def start(self, func, *args):
+		self.slots.acquire()
+
+		thread = threading.Thread(target=self.__run, args=(func, args))
+		thread.daemon = True
+		thread.start()
+
+		self.threads.append(thread)
+
+	def wait(self):
+		for thread in self.threads:
+			thread.join()
+
+		self.threads = []
+		return not self.failed
@@ -1,3 +1,7 @@
+import threading
+import time
+import sys
+
 class DummyProgress:
 	def __init__(self, callback, message):
 		self.callback = callback
@@ -13,9 +17,13 @@ class DummyProgress:
 		self.callback(self.message + "\n")
 
 class PercentProgress(DummyProgress):
+	# minimal time between redraws, in seconds
+	INTERVAL = 0.1
+
 	def __init__(self, *args):
 		DummyProgress.__init__(self, *args)
 		self.progress_shown = False
+		self.last_time = 0
 
 	def _erase(self, n):
 		if not self.progress_shown:
@@ -30,9 +38,16 @@ class PercentProgress(DummyProgress):
 		self.callback("\b" * self._erase(len(msg)) + msg)
 
 	def _show_percent(self):
-		if self.percent > self.last_percent:
-			self._show("%3d%% " % self.percent)
-			self.last_percent = self.percent
+		if self.percent <= self.last_percent:
+			return
+
+		now = time.time()
+		if self.percent < 100 and now - self.last_time < self.INTERVAL:
+			return
+
+		self._show("%3d%% " % self.percent)
+		self.last_percent = self.percent
+		self.last_time = now
 
 	def clear(self):
 		if self.last_length:
@@ -57,3 +72,140 @@ class PercentProgress(DummyProgress):
 	def finish(self):
 		n = max(self.last_length - len(self.message), 0)
 		self._show(self.message + " " * n + "\n")
+
+def format_time(seconds):
+	seconds = int(seconds)
+	if seconds >= 3600:
+		return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+	return "%d:%02d" % (seconds // 60, seconds % 60)
+
+class BoardProgress(DummyProgress):
+	"""progress of one job of a ProgressBoard"""
+
+	def __init__(self, board, name):
+		DummyProgress.__init__(self, lambda msg: None, "")
+		self.board = board
+		self.name = name
+		self.total = 0
+		self.current = 0
+
+	def init(self, total):
+		self.total = total
+		self.board.start_job(self)
+
+	def update(self, value):
+		self.current += value
+		self.board.update(value)
+
+	def finish(self):
+		self.board.finish_job(self)
+
+class ProgressBoard:
+	"""status line with the progress of several concurrent jobs
+
+	The line is redrawn at most every INTERVAL seconds, whatever the number
+	of updates.  Output written with output() goes above the status line.
+	When byte_rate (bytes per second of audio) is given the amounts are
+	bytes and the line shows MB/s and the realtime factor.
+	"""
+
+	INTERVAL = 0.2
+	MAX_JOBS = 4
+
+	def __init__(self, total, byte_rate=None, unit="tracks", write=None):
+		self.write = write or self._write_stdout
+		self.total = total
+		self.byte_rate = byte_rate
+		self.unit = unit
+
+		self.lock = threading.Lock()
+		self.start = time.time()
+		self.last_draw = 0
+		self.shown = 0
+
+		self.done = 0
+		self.finished = 0
+		self.jobs = []
+
+	@staticmethod
+	def _write_stdout(data):
+		sys.stdout.write(data)
+		sys.stdout.flush()
+
+	def job(self, name):
+		return BoardProgress(self, name)
+
+	def skip(self, amount):
+		with self.lock:
+			self.total -= amount
+
+	def start_job(self, job):
+		with self.lock:
+			self.jobs.append(job)
+			self._draw(False)
+
+	def finish_job(self, job):
+		with self.lock:
+			if job in self.jobs:
+				self.jobs.remove(job)
+
+			self.done += max(job.total - job.current, 0)
+			self.finished += 1
+			self._draw(False)
+
+	def update(self, value):
+		with self.lock:
+			self.done += value
+			self._draw(False)
+
+	def output(self, data):
+		with self.lock:
+			self._clear()
+			self.write(data)
+
+			# the status line would break an unfinished line
+			if data.endswith("\n"):
+				self._draw(True)
+
+	def close(self):
+		with self.lock:
+			self._clear()
+
+	def _clear(self):
+		if self.shown:
+			self.write("\r" + " " * self.shown + "\r")
+			self.shown = 0
+
+	def _status(self):
+		elapsed = max(time.time() - self.start, 1e-6)
+
+		items = []
+		for job in self.jobs[:self.MAX_JOBS]:
+			percent = 100 * job.current // job.total if job.total else 0
+			items.append("[%s %3d%%]" % (job.name, percent))
+
+		if len(self.jobs) > self.MAX_JOBS:
+			items.append("+%d" % (len(self.jobs) - self.MAX_JOBS))
+
+		if self.byte_rate:
+			rate = self.done / elapsed
+			items.append("%.1f MB/s %.1fx" % (rate / (1 << 20), rate / self.byte_rate))
+		else:
+			items.append("%d/%d %s" % (self.done, self.total, self.unit))
+
+		if self.done and self.total > self.done:
+			eta = (self.total - self.done) * elapsed / self.done
+			items.append("ETA " + format_time(eta))
+
+		return " ".join(items)
+
+	def _draw(self, force):
+		now = time.time()
+		if not force and now - self.last_draw < self.INTERVAL:
+			return
+
+		line = self._status()
+		self.write("\r" + line + " " * max(self.shown - len(line), 0))
+		self.shown = len(line)
+		self.last_draw = now
@@ -2,14 +2,23 @@ from . coding import to_unicode, to_bytes
 from . progress import *
 from . tools import *
 
+from . manifest import Manifest, source_id
+from . cache import Cache
+from . checksum import stream_checksum, Checksum
+from . accuraterip import AccurateRip, is_cd_audio
+from . stats import Stats, DummyStats
+from . index import DummyIndex
+from . import parallel
 from . import formats
+from . import tools
 from . import text
 
-from tempfile import mkdtemp
+from tempfile import mkdtemp, gettempdir
 
 import collections
 import subprocess
 import itertools
+import threading
 import shutil
 import sys
 import os
@@ -41,21 +50,26 @@ def convert_characters(path):
 
 class StreamInfo:
 	@staticmethod
-	def get(name):
-		stream = formats.decoder_open(name)
+	def probe(name, index=None):
+		"""stream parameters known without starting a decoder"""
 
-		if not stream or not stream.ready():
-			return None
+		info = index.get_info(name) if index is not None else None
+		if info is None:
+			info = formats.probe(name)
+			if info is not None and index is not None:
+				index.put_info(name, info)
 
-		return stream.info()
+		return info
 
 class Splitter:
 	EXT = ["ape", "flac", "wv"]
+	FRAME_BUFFER_SIZE = 0x4000
 
 	class File:
 		def __init__(self, fileobj, path):
 			self.fileobj = fileobj
 			self.path = path
+			self.done = None
 
 		def __getattr__(self, attr):
 			return getattr(self.fileobj, attr)
@@ -116,16 +130,36 @@ class Splitter:
 			self.track_info[track] = info
 			tracknumber += 1
 
-	def __init__(self, cue, opt):
+	def __init__(self, cue, opt, index=None):
 		self.cue = cue
 		self.opt = opt
+		self.index = index if index is not None else DummyIndex()
 		self.tracks = None
+		self.manifest = None
+		self.cache = None
+		self.stats = Stats(opt.stats) if opt.stats else DummyStats()
+		self.board = None
+		self.track_slots = None
+		self.track_buffer = None
+		self.board_lengths = {}
 
 		self.encoder = formats.encoder(opt.type)
 		self.tag_supported = self.encoder.is_tag_supported()
 
+		if opt.tag_padding is not None:
+			self.encoder.set_padding(opt.tag_padding)
+
+		if opt.cache_dir and not opt.dry_run and not opt.tag and not opt.verify:
+			try:
+				self.cache = Cache(opt.cache_dir, opt.cache_size << 20)
+			except OSError as err:
+				fatal("open cache %s failed: %s", quote(opt.cache_dir), err)
+
 		self.init_tags()
 
+		# the whole disc, the skip windows of accuraterip depend on it
+		self.disc_tracks = list(itertools.chain(*[f.tracks() for f in cue.files()]))
+
 	def get_track_info(self, track, tracknumber, fmt):
 		title = self.titles.pop(0) if self.titles else None
 
@@ -193,22 +227,24 @@ class Splitter:
 		if not self.tag_supported:
 			return
 
-		trackname = path if self.opt.tag else self.track_name(track)
+		trackname = quote(path if self.opt.tag else self.track_name(track))
 
-		printf("tag %s", quote(trackname))
 		if not os.path.exists(path):
-			printf(": NOT EXISTS\n")
+			printf("tag %s: NOT EXISTS\n", trackname)
 			return
 
-		printf("\n" if self.opt.dry_run else ": ")
 		if self.opt.dry_run:
+			printf("tag %s\n", trackname)
 			return
 
-		if not self.encoder.tag(path, self.track_tags(track)):
-			printf("FAILED\n")
+		with self.stats.measure("tag", self.track_name(track)):
+			ok = self.encoder.tag(path, self.track_tags(track))
+
+		if not ok:
+			printf("tag %s: FAILED\n", trackname)
 			sys.exit(1)
 
-		printf("OK\n")
+		printf("tag %s: OK\n", trackname)
 
 	def is_need_convert(self, info):
 		noteq = lambda a, b: a and a != b
@@ -233,20 +269,22 @@ class Splitter:
 			return
 
 		path = self.track_path(track)
-
-		printf("copy %s -> %s", quote(file.path), quote(path))
-		printf("\n" if self.opt.dry_run else ": ")
+		name = "copy %s -> %s" % (quote(file.path), quote(path))
 
 		if self.opt.dry_run:
+			printf("%s\n", name)
 			return
 
+		# files may be copied in parallel, the line is printed at once
 		try:
-			shutil.copyfile(file.path, path)
+			with self.stats.measure("transfer", self.track_name(track)) as timer:
+				shutil.copyfile(file.path, path)
+				timer.bytes = os.path.getsize(path)
 		except Exception as err:
-			printf("FAILED: %s\n", err)
+			printf("%s: FAILED: %s\n", name, err)
 			sys.exit(1)
 		else:
-			printf("OK\n")
+			printf("%s: OK\n", name)
 
 		self.tag(track, path)
 
@@ -262,8 +300,11 @@ class Splitter:
 			if len(line):
 				sys.stderr.write("> %s\n" % line)
 
-	def open_decode(self, path):
-		stream = formats.decoder_open(path, self.opt)
+	def open_decode(self, path, begin=None, end=None, track=None):
+		name = self.track_name(track) if track is not None else None
+
+		with self.stats.measure("decode", name):
+			stream = formats.decoder_open(path, self.opt, begin, end)
 
 		if stream is None:
 			printerr("%s: unsupported type", quote(path))
@@ -274,10 +315,23 @@ class Splitter:
 			if self.opt.verbose and self.opt.dry_run:
 				self.print_decode_info(path, stream)
 
+			if begin is None and end is None:
+				self.index.put_info(path, stream.info())
+
 		return stream
 
-	def open_encode(self, reader, path):
-		stream = self.encoder.open(reader, path, self.opt)
+	def encode_tags(self, track):
+		# cached files are stored untagged
+		if self.tag_supported and self.cache is None:
+			return self.track_tags(track)
+
+		return None
+
+	def open_encode(self, reader, track, path):
+		tags = self.encode_tags(track)
+
+		with self.stats.measure("encode", self.track_name(track)):
+			stream = self.encoder.open(reader, path, self.opt, tags)
 
 		if self.opt.dry_run:
 			if self.opt.verbose:
@@ -313,6 +367,287 @@ class Splitter:
 
 		return track.end - track.begin
 
+	def manifest_entry(self, file, track, info):
+		tags = self.track_tags(track) if self.tag_supported else None
+		name = self.track_name(track)
+
+		return {
+			"source": source_id(file.path),
+			"begin": track.begin,
+			"end": track.end,
+			"command": self.encoder.command(name, self.opt, info, tags),
+		}
+
+	def track_done(self, file, track, info):
+		if self.manifest is None or not self.opt.manifest:
+			return False
+
+		entry = self.manifest_entry(file, track, info)
+		return self.manifest.is_done(self.track_name(track), entry)
+
+	def is_track_done(self, file, track, info):
+		# the outputs are hashed once, is_file_done may have done it
+		done = file.done.get(track) if file.done is not None else None
+		if done is None:
+			done = self.track_done(file, track, info)
+
+		if not done:
+			return False
+
+		printf("split %s (%s) -> %s: DONE\n", quote(file.path),
+			self.track_timerange(track), quote(self.track_name(track)))
+
+		return True
+
+	def track_finished(self, file, track, info, checksum=None):
+		if self.manifest is None or self.opt.dry_run:
+			return
+
+		entry = self.manifest_entry(file, track, info)
+		if checksum is not None:
+			entry.update(checksum)
+
+		self.manifest.add(self.track_name(track), entry, self.track_path(track))
+
+	def cache_key(self, file, track, info):
+		name = "output." + self.encoder.ext
+		command = self.encoder.command(name, self.opt, info)
+
+		return self.cache.key(file.path, track.begin, track.end,
+			self.encoder.name, command)
+
+	def cached_checksums(self, info):
+		"""checksums an encode of info records, a cache entry without
+		them is encoded again"""
+
+		keys = []
+		if self.encoder.is_checksummed(self.opt, info):
+			keys.append("md5")
+		if self.opt.accuraterip and is_cd_audio(info):
+			keys.append("accuraterip_v1")
+
+		return keys
+
+	def fetch_cached(self, file, track, info):
+		if self.cache is None:
+			return False
+
+		path = self.track_path(track)
+		trackname = self.track_name(track)
+		required = self.cached_checksums(info)
+
+		with self.stats.measure("cache", trackname):
+			checksum = self.cache.fetch(self.cache_key(file, track, info), path, required)
+			if checksum is None:
+				return False
+
+		printf("split %s (%s) -> %s: CACHED\n", quote(file.path),
+			self.track_timerange(track), quote(trackname))
+
+		if "md5" in required:
+			self.print_checksum(trackname, checksum)
+		if "accuraterip_v1" in required:
+			self.print_accuraterip(trackname, checksum)
+
+		self.tag(track, path)
+		self.track_finished(file, track, info, checksum or None)
+
+		return True
+
+	def store_cached(self, file, track, info, checksum=None):
+		if self.cache is None:
+			return
+
+		try:
+			with self.stats.measure("cache", self.track_name(track)):
+				self.cache.store(self.cache_key(file, track, info),
+					self.track_path(track), checksum)
+		except (IOError, OSError) as err:
+			printerr("cache %s failed: %s", quote(self.track_name(track)), err)
+
+	def new_accuraterip(self, track, nframes):
+		first = track is self.disc_tracks[0]
+		last = track is self.disc_tracks[-1]
+
+		return AccurateRip(nframes, first, last)
+
+	def add_accuraterip(self, track, reader):
+		ar = self.new_accuraterip(track, reader.nframes)
+		reader.hooks.append(ar.update)
+
+		return ar
+
+	def split_accuraterip(self, track, info, nframes):
+		"""accuraterip checksums of a track being split, None if off"""
+
+		if not self.opt.accuraterip or self.opt.dry_run:
+			return None
+
+		if not is_cd_audio(info):
+			debug("accuraterip %s: not cd audio", quote(self.track_name(track)))
+			return None
+
+		return self.new_accuraterip(track, nframes)
+
+	def track_accuraterip(self, track, reader):
+		ar = self.split_accuraterip(track, reader.info(), reader.nframes)
+		if ar is not None:
+			reader.hooks.append(ar.update)
+
+		return ar
+
+	@staticmethod
+	def print_checksum(name, result):
+		printf("checksum %s: crc32 %s, md5 %s\n", quote(name),
+			result["crc32"], result["md5"])
+
+	@staticmethod
+	def print_accuraterip(name, result):
+		printf("accuraterip %s: v1 %s, v2 %s, ctdb %s\n", quote(name),
+			result["accuraterip_v1"], result["accuraterip_v2"], result["ctdb_crc32"])
+
+	def finish_track(self, file, track, info, checksum, ar, tagged):
+		"""checksums, cache entry, tags and manifest entry of a split track"""
+
+		trackname = self.track_name(track)
+		result = {}
+
+		if checksum is not None:
+			result.update(checksum.result())
+			self.print_checksum(trackname, result)
+
+		if ar is not None:
+			result.update(ar.result())
+			self.print_accuraterip(trackname, result)
+
+		self.store_cached(file, track, info, result or None)
+
+		if not tagged:
+			self.tag(track, self.track_path(track))
+
+		self.track_finished(file, track, info, result or None)
+
+	def seek(self, stream, track):
+		with self.stats.measure("seek", self.track_name(track)) as timer:
+			nframes = stream.seek(track.begin)
+
+			if nframes and not stream.seekable:
+				info = stream.info()
+				timer.bytes = nframes * info.channels * info.bits_per_sample // 8
+
+	def pump(self, out, track, reader, progress):
+		name = self.track_name(track)
+
+		with self.stats.measure("pump", name) as timer:
+			out.process(progress)
+			timer.bytes = reader.size()
+
+		with self.stats.measure("wait", name):
+			out.close()
+
+	def track_size(self, track, info, nframes):
+		begin = track.begin * info.sample_rate // 75
+		end = nframes
+		if track.end is not None:
+			end = track.end * info.sample_rate // 75
+
+		return max(end - begin, 0) * info.channels * info.bits_per_sample // 8
+
+	def files_size(self, files):
+		"""decoded size of the selected tracks and the byte rate of files"""
+
+		size = 0
+		byte_rate = None
+
+		for file, info, nframes in files:
+			tracks = [t for t in file.tracks() if t in self.tracks]
+			size += sum([self.track_size(t, info, nframes) for t in tracks])
+
+			if byte_rate is None:
+				byte_rate = info.sample_rate * info.channels * info.bits_per_sample // 8
+
+		return size, byte_rate
+
+	def open_board(self, file, info, total):
+		"""board of one file, False if the board of all files is open"""
+
+		if self.board is not None:
+			return False
+
+		size, byte_rate = self.files_size([(file, info, total)])
+
+		self.board = ProgressBoard(size, byte_rate)
+		tools.board = self.board
+		return True
+
+	@staticmethod
+	def file_length(file):
+		"""stream parameters and number of frames of file, (None, 0) if unknown"""
+
+		info = formats.probe(file.path)
+		if info is not None and info.total_samples is not None:
+			return info, info.total_samples
+
+		# the header does not know the length, the decoder does
+		stream = formats.decoder_open(file.path)
+		if not stream:
+			return None, 0
+
+		try:
+			if not stream.ready():
+				return None, 0
+
+			return stream.info(), stream.reader.getnframes()
+		finally:
+			stream.close(True)
+
+	def open_files_board(self, files):
+		# files that cannot be decoded are left out, their split fails
+		self.board_lengths = dict((file.path, self.file_length(file)) for file in files)
+
+		size, byte_rate = self.files_size([(file,) + self.board_lengths[file.path]
+			for file in files if self.board_lengths[file.path][0] is not None])
+
+		if byte_rate is None:
+			return
+
+		self.board = ProgressBoard(size, byte_rate)
+		tools.board = self.board
+
+	def close_board(self):
+		if self.board is not None:
+			self.board.close()
+			self.board = None
+			tools.board = None
+
+	def skip_board(self, track, info, nframes):
+		if self.board is not None:
+			self.board.skip(self.track_size(track, info, nframes))
+
+	def skip_file_board(self, file):
+		if self.board is None:
+			return
+
+		info, nframes = self.board_lengths[file.path]
+		if info is not None:
+			for track in file.tracks():
+				if track in self.tracks:
+					self.skip_board(track, info, nframes)
+
+	def read_size(self, reader):
+		"""frames per read of a decoder reader, --chunk-size if given"""
+
+		if self.opt.chunk_size:
+			return max(1, (self.opt.chunk_size << 10) // reader.bytes_per_frame)
+
+		return self.FRAME_BUFFER_SIZE
+
+	def job_progress(self, track):
+		if self.board is None:
+			return DummyProgress(lambda msg: None, "")
+
+		return self.board.job("%02d" % track.number)
+
 	def progress(self, message):
 		func = lambda msg: printf("%s", msg)
 
@@ -321,16 +656,323 @@ class Splitter:
 
 		return DummyProgress(func, message)
 
-	def split_file(self, file):
-		stream = self.open_decode(file.path)
+	def encode_track(self, file, track, reader, ar=None):
+		ts = self.track_timerange(track)
+		trackname = self.track_name(track)
+		path = self.track_path(track)
+
+		out = self.open_encode(reader, track, path)
+		if out is None:
+			printf("split %s (%s) -> %s: FAILED\n",
+				quote(file.path), ts, quote(trackname))
+			sys.exit(1)
+
+		self.pump(out, track, reader, self.job_progress(track))
+
+		printf("split %s (%s) -> %s: OK\n", quote(file.path), ts, quote(trackname))
+
+		self.finish_track(file, track, reader.info(), out.checksum, ar, out.tagged)
+
+	def encode_channel(self, file, track, reader, ar=None):
+		try:
+			self.encode_track(file, track, reader, ar)
+		finally:
+			reader.abort()
+
+	def encode_range(self, file, track, source, rate):
+		begin = track.begin * rate // 75
+		end = track.end * rate // 75 if track.end is not None else None
+
+		stream = self.open_decode(source, begin, end, track)
 		if not stream:
 			sys.exit(1)
 
+		try:
+			reader = stream.get_reader(self.track_length(track))
+			ar = self.track_accuraterip(track, reader)
+			self.encode_track(file, track, reader, ar)
+		finally:
+			stream.close()
+
+	def spill_file(self, file, stream):
+		name = "decode %s -> %s" % (quote(file.path), quote(self.opt.spill_dir or gettempdir()))
+
+		try:
+			path = stream.spill(self.opt.spill_dir)
+		except Exception as err:
+			printf("%s: FAILED: %s\n", name, err)
+			sys.exit(1)
+
+		printf("%s: OK\n", name)
+		return path
+
+	def split_tracks_parallel(self, file, info, total, stream):
+		# the tracks of files split at once share the jobs and the buffer
+		pool = parallel.Pool(self.opt.jobs, self.track_slots)
+		buffer = self.track_buffer or parallel.Buffer(self.opt.buffer_size << 20)
+
+		rate = info.sample_rate
+
+		own_board = self.opt.show_progress and self.open_board(file, info, total)
+
+		source = None
+		if formats.is_range_supported(file.path):
+			source = file.path
+		elif self.opt.spill:
+			source = self.spill_file(file, stream)
+
+		try:
+			for track in file.tracks():
+				if track not in self.tracks:
+					if self.opt.verbose:
+						ts = self.track_timerange(track)
+						printf("split %s (%s): SKIP\n", quote(file.path), ts)
+					continue
+
+				if self.is_track_done(file, track, info):
+					self.skip_board(track, info, total)
+					continue
+
+				if self.fetch_cached(file, track, info):
+					self.skip_board(track, info, total)
+					continue
+
+				if source is not None:
+					pool.start(self.encode_range, file, track, source, rate)
+					if pool.failed:
+						break
+					continue
+
+				self.seek(stream, track)
+				reader = stream.get_reader(self.track_length(track))
+				ar = self.track_accuraterip(track, reader)
+				reader = parallel.ChannelReader(reader, buffer, self.read_size(reader))
+
+				pool.start(self.encode_channel, file, track, reader, ar)
+				if not reader.feed() or pool.failed:
+					break
+
+			ok = pool.wait()
+		finally:
+			if own_board:
+				self.close_board()
+
+			if source is not None and source != file.path:
+				os.remove(source)
+
+		if not ok:
+			if stream is not None:
+				stream.close()
+			sys.exit(1)
+
+	def async_source(self, file, track, begin, nframes, shared):
+		from . import engine
+
+		if shared is not None:
+			return shared.source(begin, nframes)
+
+		if file.path.lower().endswith(".wav"):
+			return engine.MapSource(file.path, begin, nframes)
+
+		decoder = formats.file_decoder(file.path)
+		args = decoder.decode_range(file.path, begin, begin + nframes)
+		return engine.PipeSource(args, nframes)
+
+	def async_job(self, file, track, info, source, nframes):
+		from . import engine
+
+		path = self.track_path(track)
+		tags = self.encode_tags(track)
+
+		args = None
+		if not self.encoder.is_writer(self.opt, info):
+			args = self.encoder.encode(path, self.opt, info, tags)
+
+		params = (info.channels, info.bits_per_sample // 8, info.sample_rate)
+		job = engine.Job(source, path, args, params, nframes)
+
+		job.track = track
+		job.tagged = self.encoder.is_tagged(self.opt, info, tags)
+		job.progress = self.job_progress(track)
+
+		job.checksum = None
+		if self.encoder.is_checksummed(self.opt, info):
+			job.checksum = Checksum()
+			job.hooks.append(job.checksum.update)
+
+		job.ar = self.split_accuraterip(track, info, nframes)
+		if job.ar is not None:
+			job.hooks.append(job.ar.update)
+
+		return job
+
+	def async_done(self, file, info, job):
+		track = job.track
+		ts = self.track_timerange(track)
+		trackname = self.track_name(track)
+		name = "split %s (%s) -> %s" % (quote(file.path), ts, quote(trackname))
+
+		if job.status is not None:
+			printf("%s: FAILED\n", name)
+			self.print_command_error(job.stage, job)
+			self.async_failed = True
+			return
+
+		self.stats.add("pump", job.elapsed, job.written, trackname)
+		printf("%s: OK\n", name)
+
+		self.finish_track(file, track, info, job.checksum, job.ar, job.tagged)
+
+	def async_jobs(self, file, info, total, stream):
+		"""engine jobs of the tracks of file, the decoders they read
+		and the callback of the finished jobs"""
+
+		from . import engine
+
+		rate = info.sample_rate
+
+		shared = None
+		if not formats.is_range_supported(file.path):
+			decoder = formats.file_decoder(file.path)
+			shared = engine.SharedDecoder(decoder.decode(file.path))
+
+		jobs = []
+		for track in file.tracks():
+			if track not in self.tracks:
+				if self.opt.verbose:
+					ts = self.track_timerange(track)
+					printf("split %s (%s): SKIP\n", quote(file.path), ts)
+				continue
+
+			if self.is_track_done(file, track, info) or self.fetch_cached(file, track, info):
+				self.skip_board(track, info, total)
+				continue
+
+			begin = track.begin * rate // 75
+			end = track.end * rate // 75 if track.end is not None else total
+			nframes = max(min(end, total) - begin, 0)
+
+			source = self.async_source(file, track, begin, nframes, shared)
+			jobs.append(self.async_job(file, track, info, source, nframes))
+
+		if stream is not None:
+			stream.close()
+
+		decoders = [shared] if shared is not None and jobs else []
+		done = lambda job: self.async_done(file, info, job)
+
+		return jobs, decoders, done
+
+	def run_async(self, jobs, decoders, done, blocking=()):
+		# imported here, asyncio is slow to load and needs python 3
+		from . import engine
+
+		self.async_failed = False
+		engine.AsyncEngine(self.opt.jobs).run(jobs, decoders, done, blocking)
+
+		if self.async_failed:
+			sys.exit(1)
+
+	def split_tracks_async(self, file, info, total, stream):
+		own_board = self.opt.show_progress and self.open_board(file, info, total)
+
+		try:
+			self.run_async(*self.async_jobs(file, info, total, stream))
+		finally:
+			if own_board:
+				self.close_board()
+
+	def is_file_done(self, file):
+		# the manifest entries need the stream parameters,
+		# known ones spare starting the decoder
+		info = StreamInfo.probe(file.path, self.index)
+		if info is None:
+			return False
+
+		tracks = [t for t in file.tracks() if t in self.tracks]
+		file.done = dict((track, self.track_done(file, track, info)) for track in tracks)
+		if not all(file.done.values()):
+			return False
+
+		for track in file.tracks():
+			if track not in self.tracks:
+				if self.opt.verbose:
+					printf("split %s (%s): SKIP\n", quote(file.path),
+						self.track_timerange(track))
+				continue
+
+			self.is_track_done(file, track, info)
+
+		return True
+
+	def open_file(self, file, copy=None):
+		"""stream parameters, length and decoder of file, None if there
+		is nothing to decode
+
+		The decoder is None when the tracks are decoded separately and
+		the file headers give the parameters. A file that needs no
+		conversion is copied, or passed to copy() if it is given.
+		"""
+
+		if self.is_file_done(file):
+			self.skip_file_board(file)
+			return None
+
+		stream = None
+
 		if file.ntracks() == 1:
-			if not self.is_need_convert(stream.info()):
+			# a decoder started for the parameters stays the file's decoder
+			info = StreamInfo.probe(file.path, self.index)
+			if info is None:
+				stream = self.open_decode(file.path)
+				if not stream:
+					sys.exit(1)
+
+				info = stream.info()
+
+			if not self.is_need_convert(info):
+				if stream is not None:
+					stream.close(True)
+
+				(copy or self.copy_file)(file)
+				self.skip_file_board(file)
+				return None
+
+		# the engine and the range decoders of parallel jobs read the file
+		# themselves, a whole file decoder would wait on its pipe
+		if stream is None and not self.opt.dry_run and (self.opt.engine == "asyncio" or
+				self.opt.jobs > 1 and formats.is_range_supported(file.path)):
+			info = formats.probe(file.path)
+			if info is not None and info.total_samples is not None:
+				return info, info.total_samples, None
+
+		if stream is None:
+			stream = self.open_decode(file.path)
+			if not stream:
+				sys.exit(1)
+
+		# dry runs have no reader, their decoder knows the length
+		info = stream.info()
+		total = stream.reader.getnframes() if stream.reader is not None else info.total_samples
+
+		return info, total, stream
+
+	def split_file(self, file):
+		opened = self.open_file(file)
+		if opened is None:
+			return
+
+		info, total, stream = opened
+
+		if self.opt.engine == "asyncio" and not self.opt.dry_run:
+			self.split_tracks_async(file, info, total, stream)
+			return
+
+		if self.opt.jobs > 1 and not self.opt.dry_run:
+			self.split_tracks_parallel(file, info, total, stream)
+			if stream is not None:
 				stream.close()
-				self.copy_file(file)
-				return
+			return
 
 		for track in file.tracks():
 			ts = self.track_timerange(track)
@@ -340,13 +982,20 @@ class Splitter:
 					printf("split %s (%s): SKIP\n", quote(file.path), ts)
 				continue
 
+			if self.is_track_done(file, track, info):
+				continue
+
+			if self.fetch_cached(file, track, info):
+				continue
+
 			trackname = self.track_name(track)
 			path = self.track_path(track)
 
-			stream.seek(track.begin)
+			self.seek(stream, track)
 			reader = stream.get_reader(self.track_length(track))
+			ar = self.track_accuraterip(track, reader)
 
-			out = self.open_encode(reader, path)
+			out = self.open_encode(reader, track, path)
 
 			printf("split %s (%s) -> %s", quote(file.path), ts, quote(trackname))
 			printf("\n" if self.opt.dry_run else ": ")
@@ -358,13 +1007,57 @@ class Splitter:
 				printf("FAILED\n")
 				sys.exit(1)
 
-			out.process(self.progress("OK"))
-			out.close()
+			self.pump(out, track, reader, self.progress("OK"))
 
-			self.tag(track, path)
+			self.finish_track(file, track, info, out.checksum, ar, out.tagged)
 
 		stream.close()
 
+	def split_files_async(self, files):
+		jobs, decoders, callbacks, copies = [], [], {}, []
+
+		for file in files:
+			# the copies run next to the jobs, in the same limit
+			opened = self.open_file(file, copies.append)
+			if opened is None:
+				continue
+
+			file_jobs, file_decoders, done = self.async_jobs(file, *opened)
+			jobs.extend(file_jobs)
+			decoders.extend(file_decoders)
+			callbacks.update((job, done) for job in file_jobs)
+
+		copy = lambda file: lambda: self.copy_file(file)
+		self.run_async(jobs, decoders, lambda job: callbacks[job](job),
+			[copy(file) for file in copies])
+
+	def split_files_parallel(self, files):
+		"""split the files of a multi file cue sheet at once"""
+
+		if self.opt.show_progress:
+			self.open_files_board(files)
+
+		try:
+			if self.opt.engine == "asyncio":
+				self.split_files_async(files)
+				return
+
+			# every file gets a thread, the tracks of all files share
+			# the jobs and the memory budget of one file
+			self.track_slots = threading.Semaphore(self.opt.jobs)
+			self.track_buffer = parallel.Buffer(self.opt.buffer_size << 20)
+
+			pool = parallel.Pool(self.opt.jobs)
+			for file in files:
+				pool.start(self.split_file, file)
+				if pool.failed:
+					break
+
+			if not pool.wait():
+				sys.exit(1)
+		finally:
+			self.close_board()
+
 	def check_duplicates(self):
 		names = [x.name for x in self.track_info.values()]
 		dup = [k for k, v in collections.Counter(names).items() if v > 1]
@@ -381,7 +1074,9 @@ class Splitter:
 			printf("copy %s -> %s: ", quote(file), quote(dest))
 
 			try:
-				shutil.copy(path, dest)
+				with self.stats.measure("transfer", file) as timer:
+					shutil.copy(path, dest)
+					timer.bytes = os.path.getsize(path)
 			except Exception as err:
 				printf("FAILED: %s\n", err)
 				sys.exit(1)
@@ -393,6 +1088,11 @@ class Splitter:
 
 		if self.opt.tag:
 			self.tag_files()
+			self.stats.report()
+			return
+
+		if self.opt.verify:
+			self.verify_files()
 			return
 
 		files = self.open_files()
@@ -405,8 +1105,18 @@ class Splitter:
 				tempdir = mkdtemp(prefix="cutter-")
 				self.dest = to_unicode(tempdir)
 
-		for file in files:
-			self.split_file(file)
+		if self.opt.manifest or self.opt.checksum or self.opt.accuraterip:
+			self.manifest = Manifest(self.realpath or self.dest)
+
+		try:
+			if len(files) > 1 and self.opt.jobs > 1 and not self.opt.dry_run:
+				self.split_files_parallel(files)
+			else:
+				for file in files:
+					self.split_file(file)
+		finally:
+			if self.manifest is not None:
+				self.manifest.close()
 
 		if self.realpath:
 			self.transfer_files(self.dest, self.realpath)
@@ -415,10 +1125,63 @@ class Splitter:
 			except Exception as err:
 				fatal("rm %s failed: %s\n", self.dest, err)
 
+		self.stats.report()
+
 	def tag_files(self):
 		for track in self.all_tracks():
 			self.tag(track, self.track_path(track))
 
+	def verify_track(self, track, checksums):
+		trackname = quote(self.track_name(track))
+		path = self.track_path(track)
+
+		if not os.path.exists(path):
+			printf("verify %s: NOT EXISTS\n", trackname)
+			return False
+
+		stored = checksums.get(self.track_name(track), {})
+		if "md5" not in stored:
+			printf("verify %s: NO CHECKSUM\n", trackname)
+			return False
+
+		if self.opt.dry_run:
+			printf("verify %s\n", trackname)
+			return True
+
+		stream = formats.decoder_open(path)
+		if stream is None:
+			printf("verify %s: SKIP (cannot decode)\n", trackname)
+			return True
+
+		if not stream.ready():
+			printf("verify %s: FAILED\n", trackname)
+			self.print_command_error("decode", stream)
+			return False
+
+		try:
+			reader = stream.get_reader(None)
+			checksum = stream_checksum(reader, self.read_size(reader))
+		finally:
+			stream.close()
+
+		if checksum["md5"] != stored["md5"] or checksum["crc32"] != stored.get("crc32"):
+			printf("verify %s: MISMATCH\n", trackname)
+			return False
+
+		printf("verify %s: OK\n", trackname)
+		return True
+
+	def verify_files(self):
+		checksums = Manifest(self.dest).tracks
+
+		failed = 0
+		for track in self.all_tracks():
+			if not self.verify_track(track, checksums):
+				failed += 1
+
+		if failed:
+			fatal("%d of %d tracks failed verification", failed, len(self.all_tracks()))
+
 	def all_tracks(self):
 		if self.tracks:
 			return self.tracks
@@ -450,6 +1213,33 @@ class Splitter:
 				if v is not "":
 					printf("%s=%s\n", k.upper(), v)
 
+	def dump_checksums(self):
+		for file in self.open_files():
+			stream = self.open_decode(file.path)
+			if not stream:
+				sys.exit(1)
+
+			if not is_cd_audio(stream.info()):
+				printerr("%s: not cd audio, skipped", quote(file.path))
+				stream.close()
+				continue
+
+			for track in file.tracks():
+				if track not in self.tracks:
+					continue
+
+				stream.seek(track.begin)
+				reader = stream.get_reader(self.track_length(track))
+				ar = self.add_accuraterip(track, reader)
+
+				maxframes = self.read_size(reader)
+				while len(reader.read(maxframes)):
+					pass
+
+				self.print_accuraterip(self.track_name(track), ar.result())
+
+			stream.close()
+
 	def dump_tracks(self):
 		for track in self.all_tracks():
 			printf("%s\n", self.track_path(track))
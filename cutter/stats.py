@@ -0,0 +1,115 @@
+from . tools import printf
+
+import threading
+import json
+import time
+
+STAGES = [
+	("decode", "decoder start"),
+	("seek", "seek"),
+	("encode", "encoder start"),
+	("pump", "pump"),
+	("wait", "encoder wait"),
+	("tag", "tag"),
+	("cache", "cache"),
+	("transfer", "transfer"),
+]
+
+class Timer:
+	def __init__(self, stats, stage, track):
+		self.stats = stats
+		self.stage = stage
+		self.track = track
+		self.bytes = 0
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *exc):
+		self.stats.add(self.stage, time.time() - self.start, self.bytes, self.track)
+
+class DummyStats:
+	def measure(self, stage, track=None):
+		return Timer(self, stage, track)
+
+	def add(self, stage, seconds, nbytes=0, track=None):
+		pass
+
+	def report(self):
+		pass
+
+class Stats(DummyStats):
+	"""time and bytes spent in every stage, per track and per album"""
+
+	def __init__(self, output="-"):
+		self.output = output
+		self.lock = threading.Lock()
+		self.start = time.time()
+
+		self.album = {}
+		self.tracks = {}
+		self.order = []
+
+	@staticmethod
+	def _add(stages, stage, seconds, nbytes):
+		entry = stages.setdefault(stage, [0.0, 0])
+		entry[0] += seconds
+		entry[1] += nbytes
+
+	def add(self, stage, seconds, nbytes=0, track=None):
+		with self.lock:
+			self._add(self.album, stage, seconds, nbytes)
+
+			if track is not None:
+				if track not in self.tracks:
+					self.tracks[track] = {}
+					self.order.append(track)
+
+				self._add(self.tracks[track], stage, seconds, nbytes)
+
+	@staticmethod
+	def _stages(stages):
+		return dict((k, {"seconds": round(v[0], 6), "bytes": v[1]})
+			for k, v in stages.items())
+
+	def result(self):
+		return {
+			"seconds": round(time.time() - self.start, 6),
+			"album": self._stages(self.album),
+			"tracks": [dict(name=name, stages=self._stages(self.tracks[name]))
+				for name in self.order],
+		}
+
+	def print_table(self, result):
+		stages = [(k, title) for k, title in STAGES if k in self.album]
+
+		printf("%-30s", "track")
+		for _, title in stages:
+			printf(" %13s", title)
+		printf("\n")
+
+		for track in result["tracks"]:
+			printf("%-30s", track["name"][:30])
+			for k, _ in stages:
+				seconds = track["stages"].get(k, {}).get("seconds", 0)
+				printf(" %12.3fs", seconds)
+			printf("\n")
+
+		printf("\n%-14s %10s %12s %10s\n", "stage", "seconds", "bytes", "MB/s")
+		for k, title in stages:
+			seconds, nbytes = self.album[k]
+			rate = nbytes / seconds / (1 << 20) if seconds and nbytes else 0
+			printf("%-14s %10.3f %12d %10.2f\n", title, seconds, nbytes, rate)
+
+		printf("%-14s %10.3f\n", "total", result["seconds"])
+
+	def report(self):
+		result = self.result()
+
+		if self.output == "-":
+			self.print_table(result)
+			return
+
+		with open(self.output, "w") as fp:
+			json.dump(result, fp, indent=1, sort_keys=True)
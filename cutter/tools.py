@@ -3,11 +3,19 @@ import os
 
 progname = os.path.basename(sys.argv[0])
 
+# progress board whose status line is kept below the output
+board = None
+
 def quote(s, ch = '"'):
 	return s if " " not in s else ch + s + ch
 
 def printf(fmt, *args):
 	out = fmt % args
+
+	if board is not None:
+		board.output(out)
+		return
+
 	sys.stdout.write(out)
 
 	if out[-1] != '\n':